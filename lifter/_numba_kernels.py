@@ -0,0 +1,117 @@
+"""
+Optional numba kernels for numeric reductions used by
+:py:mod:`lifter.aggregates`, and for filters on numeric columns
+used by :py:class:`lifter.backends.python.ColumnarStore`.
+
+Kernels are compiled lazily, on first use, so importing lifter does not
+pay numba's import and compilation costs.
+"""
+
+_kernels = {}
+
+
+def nsum(a):
+    s = a[0]
+    for i in range(1, a.shape[0]):
+        s += a[i]
+    return s
+
+
+# Loops are written explicitly rather than calling a.min() / a.max()
+# inside the kernel, which numba does not vectorize as well
+def nmin(a):
+    m = a[0]
+    for i in range(1, a.shape[0]):
+        if a[i] < m:
+            m = a[i]
+    return m
+
+
+def nmax(a):
+    m = a[0]
+    for i in range(1, a.shape[0]):
+        if a[i] > m:
+            m = a[i]
+    return m
+
+
+def nmean(a):
+    s = 0.0
+    for i in range(a.shape[0]):
+        s += a[i]
+    return s / a.shape[0]
+
+
+_functions = {
+    'sum': (nsum, True),
+    'min': (nmin, False),
+    'max': (nmax, False),
+    'mean': (nmean, True),
+}
+
+
+def get_kernel(name):
+    """
+    Return the compiled kernel for the given reduction, or None
+    if numba is not available
+    """
+    try:
+        return _kernels[name]
+    except KeyError:
+        pass
+
+    try:
+        import numba
+    except ImportError:
+        kernel = None
+    else:
+        func, fastmath = _functions[name]
+        # fastmath would break NaN handling in comparisons, so we only
+        # enable it for additions
+        kernel = numba.njit(cache=True, fastmath=fastmath)(func)
+
+    _kernels[name] = kernel
+    return kernel
+
+
+FILTER_KERNEL_TEMPLATE = """
+def kernel(_out, {arguments}):
+    for i in _prange(_out.shape[0]):
+        _out[i] = {expression}
+"""
+
+_filter_kernels = {}
+FILTER_KERNELS_CACHE_SIZE = 256
+
+
+def get_filter_kernel(expression, arguments_count):
+    """
+    Return a parallel kernel filling its first argument with the result of the given
+    expression for each row index ``i``, or None if numba is not available.
+
+    Kernels are cached by expression: queries with the same structure
+    reuse the same kernel, even with other values.
+    """
+    arguments = ['_c{0}'.format(i) for i in range(arguments_count)]
+    source = FILTER_KERNEL_TEMPLATE.format(
+        arguments=', '.join(arguments),
+        expression=expression)
+    try:
+        return _filter_kernels[source]
+    except KeyError:
+        pass
+
+    try:
+        import numba
+    except ImportError:
+        kernel = None
+    else:
+        namespace = {'_prange': numba.prange}
+        exec(compile(source, '<lifter kernel>', 'exec'), namespace)
+        # generated code has no source file, so it cannot use numba's disk cache
+        kernel = numba.njit(parallel=True)(namespace['kernel'])
+
+    if len(_filter_kernels) >= FILTER_KERNELS_CACHE_SIZE:
+        _filter_kernels.clear()
+    _filter_kernels[source] = kernel
+    return kernel
@@ -4,6 +4,8 @@ from . import models
 from . import utils
 
 class Adapter(object):
+    __slots__ = ('attributes_converter', '_cleaner_map', '_field_cleaners')
+
     def __init__(self, attributes_converter=utils.to_snake_case):
         self.attributes_converter = attributes_converter
 
@@ -28,26 +30,80 @@ class Adapter(object):
     def clean(self, data, model):
         return data
 
+    def get_cleaners(self):
+        """
+        Return a dictionary mapping field names to the corresponding
+        ``clean_<field>`` method. It is computed only once per adapter.
+        """
+        try:
+            return self._cleaner_map
+        except AttributeError:
+            pass
+
+        prefix = 'clean_'
+        self._cleaner_map = {
+            name[len(prefix):]: getattr(self, name)
+            for name in dir(self)
+            if name.startswith(prefix)
+        }
+        return self._cleaner_map
+
+    def get_field_cleaners(self, model):
+        """
+        Return a dictionary mapping field names of the given model to a
+        ``f(data, value)`` callable returning the cleaned value. Keys that
+        do not need any cleaning are omitted. It is computed only once per
+        adapter and model, so parsing many records only requires a single
+        lookup per key.
+        """
+        try:
+            cache = self._field_cleaners
+        except AttributeError:
+            cache = self._field_cleaners = {}
+
+        try:
+            return cache[model]
+        except KeyError:
+            pass
+
+        fields = model._meta.fields
+        field_cleaners = {}
+        for key, field in fields.items():
+            # We use the default field conversion
+            field_cleaners[key] = _field_cleaner(self, field)
+        for key, cleaner in self.get_cleaners().items():
+            field_cleaners[key] = _custom_cleaner(cleaner, model, fields.get(key))
+
+        cache[model] = field_cleaners
+        return field_cleaners
+
     def _clean_fields(self, data, model):
         cleaned_data = {}
+        field_cleaners = self.get_field_cleaners(model)
         for key, value in data.items():
-            cleaner = 'clean_{0}'.format(key)
-            field = model._meta.fields.get(key, None)
-            if hasattr(self, cleaner):
-                cleaned_data[key] = getattr(self, cleaner)(data, value, model, field)
+            cleaner = field_cleaners.get(key)
+            if cleaner is None:
+                cleaned_data[key] = value
             else:
-                if field:
-                    # We use the default field conversion
-                    cleaned_data[key] = field.to_python(self, value)
-                else:
-                    cleaned_data[key] = value
+                cleaned_data[key] = cleaner(data, value)
         return cleaned_data
 
 
+def _field_cleaner(adapter, field):
+    to_python = field.to_python
+    return lambda data, value: to_python(adapter, value)
+
+
+def _custom_cleaner(cleaner, model, field):
+    return lambda data, value: cleaner(data, value, model, field)
+
+
 class DictAdapter(Adapter):
     """
     Dummy adapter that simply map dictionary keys to model attributes
     """
+    __slots__ = ('recursive', 'key')
+
     def __init__(self, *args, **kwargs):
         self.recursive = kwargs.pop('recursive', True)
         # if any, we'll map only attributes under the given key
@@ -60,15 +116,21 @@ class DictAdapter(Adapter):
         else:
             to_convert = data
 
-        if self.recursive:
-            # we convert subdictionaries to proper model instances
-            for key, value in to_convert.items():
-                if isinstance(value, dict):
-                    to_convert[key] = self.parse(value, models.Model)
-        return to_convert
+        if not self.recursive:
+            return to_convert
+
+        # we convert subdictionaries to proper model instances, without
+        # mutating the given data, so it can be safely reused
+        parse = self.parse
+        return {
+            key: parse(value, models.Model) if isinstance(value, dict) else value
+            for key, value in to_convert.items()
+        }
 
 
 class RegexAdapter(Adapter):
+    __slots__ = ('regex', 'compiled_regex')
+
     def __init__(self, *args, **kwargs):
         self.regex = kwargs.pop('regex', self.regex)
 
@@ -81,7 +143,13 @@ class RegexAdapter(Adapter):
         return match.groupdict()
 
 
+@utils.memoize(maxsize=1024)
+def strip_namespace(tag):
+    return tag.rpartition('}')[2]
+
+
 class ETreeAdapter(Adapter):
+    __slots__ = ()
 
     def get_raw_data(self, data, model):
 
@@ -95,4 +163,4 @@ class ETreeAdapter(Adapter):
         Since the tag may be fully namespaced, we want to strip the namespace
         information
         """
-        return tag.split('}')[-1]
+        return strip_namespace(tag)
@@ -1,4 +1,82 @@
+import six
+
+from . import lookups
 from . import utils
+from . import _numba_kernels
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Below this number of values, converting them to a numpy array
+# costs more than the pure python reduction
+NUMPY_THRESHOLD = 64
+
+# Minimum number of values to use numba kernels, that take time to
+# compile, see ColumnarStore.kernel_threshold
+KERNEL_THRESHOLD = 100000
+
+
+def _asarray(values):
+    """
+    Return the given values as a one dimensional numeric numpy array,
+    or None if numpy is not available or values are not numeric
+    """
+    if numpy is None or len(values) < NUMPY_THRESHOLD:
+        return None
+    if isinstance(values, numpy.ndarray):
+        array = values
+    else:
+        try:
+            array = numpy.asarray(values)
+        except (TypeError, ValueError):
+            return None
+    if array.ndim != 1 or array.dtype.kind not in 'iuf':
+        # strings, decimals, or any other object
+        return None
+    if array is not values and array.dtype.kind == 'f' and _has_large_integers(values, array):
+        # they were rounded when converted to floats
+        return None
+    return array
+
+
+def _has_large_integers(values, array):
+    """
+    Return True if some of the given values are integers that cannot
+    be converted exactly to the floats of the given array
+    """
+    bound = lookups.FLOAT_EXACT_BOUND
+    if not numpy.any(numpy.abs(array) > bound):
+        return False
+    return any(
+        isinstance(v, six.integer_types) and not isinstance(v, bool) and abs(v) > bound
+        for v in values)
+
+
+def _reduce(array, name):
+    """
+    Apply the given reduction on a numeric numpy array, using
+    a numba kernel when available, on large arrays
+    """
+    kernel = None
+    if len(array) >= KERNEL_THRESHOLD:
+        kernel = _numba_kernels.get_kernel(name)
+    if kernel is None:
+        # numpy scalars are not handled by json, among others
+        return getattr(array, name)().item()
+    return kernel(numpy.ascontiguousarray(array))
+
+
+def _can_sum(array):
+    """
+    Return True if the given array can be summed in its own dtype: integers
+    are summed in int64 by numpy and numba, and would overflow silently
+    """
+    if array.dtype.kind == 'f':
+        return True
+    bound = max(abs(int(array.min())), abs(int(array.max())))
+    return bound * len(array) < 2 ** 63
 
 
 class Aggregate(object):
@@ -12,30 +90,116 @@ class Aggregate(object):
     def aggregate(self, values):
         raise NotImplementedError
 
+    def reduce(self, values, array):
+        """
+        Same as :py:meth:`aggregate`, when the values were already
+        converted to a numpy array.
+
+        :param array: the values, as a numeric numpy array,
+            or None if they cannot be converted
+        """
+        return self.aggregate(values)
+
     def __hash__(self):
         return hash((self.attr_name,))
-        
-class Sum(Aggregate):
-    name = 'sum'
+
+
+class NumericAggregate(Aggregate):
+    """An aggregate using numpy (and numba) on large numeric columns"""
 
     def aggregate(self, values):
-        return sum(values)
+        return self.reduce(values, _asarray(values))
 
+    def reduce(self, values, array):
+        raise NotImplementedError
+
+
+class Sum(NumericAggregate):
+    name = 'sum'
+
+    def reduce(self, values, array):
+        if array is None or not _can_sum(array):
+            return sum(values)
+        return _reduce(array, 'sum')
 
-class Min(Aggregate):
+
+class Min(NumericAggregate):
     name = 'min'
 
-    def aggregate(self, values):
-        return min(values)
+    def reduce(self, values, array):
+        if array is None:
+            return min(values)
+        return _reduce(array, 'min')
 
-class Max(Aggregate):
+class Max(NumericAggregate):
     name = 'max'
 
-    def aggregate(self, values):
-        return max(values)
+    def reduce(self, values, array):
+        if array is None:
+            return max(values)
+        return _reduce(array, 'max')
 
-class Avg(Aggregate):
+class Avg(NumericAggregate):
     name = 'avg'
 
-    def aggregate(self, values):
-        return float(sum(values)) / len(values)
+    def reduce(self, values, array):
+        if array is None or not _can_sum(array):
+            return float(sum(values)) / len(values)
+        if array.dtype.kind != 'f':
+            # same rounding as python, that sums integers exactly
+            return float(_reduce(array, 'sum')) / len(values)
+        return float(_reduce(array, 'mean'))
+
+
+# Builtins that give the same result as our aggregates.
+# sum is not listed, since numpy does not sum floats the same way python does
+BUILTIN_AGGREGATES = {
+    min: Min(None),
+    max: Max(None),
+}
+
+
+def get_aggregate(func):
+    """
+    Return the :py:class:`NumericAggregate` instance implementing the given
+    aggregation function with :py:meth:`NumericAggregate.reduce`,
+    or None for other functions
+    """
+    owner = getattr(func, '__self__', None)
+    if isinstance(owner, NumericAggregate):
+        # Subclasses overriding aggregate() must not be bypassed
+        if six.get_method_function(func) is six.get_unbound_function(NumericAggregate.aggregate):
+            return owner
+        return None
+    try:
+        return BUILTIN_AGGREGATES.get(func)
+    except TypeError:
+        # unhashable callable
+        return None
+
+
+def aggregate_columns(columns, aggregations):
+    """
+    Apply each aggregation on its values, and return the results in the same order.
+
+    :param columns: a dict of values, by aggregation key. Aggregations on the
+        same path may share the same list.
+    :param aggregations: a list of ``(key, aggregation)`` tuples
+
+    Each list of values is converted to a numpy array at most once,
+    and the array is shared by all aggregates applied on it.
+    """
+    arrays = {}
+    results = []
+    for key, aggregation in aggregations:
+        values = columns[key]
+        aggregate = get_aggregate(aggregation.func)
+        if aggregate is None:
+            results.append(aggregation.aggregate(values))
+            continue
+        try:
+            array = arrays[id(values)]
+        except KeyError:
+            array = arrays[id(values)] = _asarray(values)
+        results.append(aggregate.reduce(values, array))
+    return results
@@ -0,0 +1,341 @@
+"""
+Compile query filters to plain python functions, for the python backend.
+
+Instead of walking the query tree for each row, we generate the source of a
+single python expression from the tree (such as ``o['a'] == _c0 and o['b'] > _c1``)
+and compile it once. The way values are accessed (item or attribute lookup)
+is guessed from a sample row.
+
+Rows that do not match the sample (missing keys, nested iterables, other types...)
+make the compiled expression raise, in which case we fall back to the generic
+implementation for this row, so results are always the same.
+"""
+import keyword
+import re
+
+import six
+
+from .. import lookups
+from .. import store
+from .. import utils
+from .. import _numba_kernels
+
+IDENTIFIER_REGEX = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# Errors raised by the compiled expression when a row does not match the sample
+FALLBACK_ERRORS = (AttributeError, KeyError, TypeError, IndexError)
+
+PREDICATE_TEMPLATE = """
+def factory({arguments}):
+    def predicate(o):
+        if type(o) is not _type:
+            return _fallback(o)
+        try:
+            return {expression}
+        except _errors:
+            return _fallback(o)
+    return predicate
+"""
+
+_factories = {}
+FACTORIES_CACHE_SIZE = 256
+
+
+def is_plain_value(obj, name, resolver):
+    """
+    Return True if the given value is stored as is in obj (and not
+    computed by a property, for instance)
+    """
+    if resolver is utils.resolve_item:
+        return True
+    return name in getattr(obj, '__dict__', ())
+
+
+class Compiler(object):
+    """
+    Hold the state needed to generate the source of a compiled query
+    """
+    varname = 'o'
+
+    def __init__(self, sample, hints):
+        self.sample = sample
+        self.hints = hints
+        self.constants = []
+
+    def add_constant(self, value):
+        """
+        Make the given value available to the generated code, and return
+        the name under which it can be accessed
+        """
+        name = '_c{0}'.format(len(self.constants))
+        self.constants.append(value)
+        return name
+
+    def get_soft_fail(self, node):
+        return self.hints.get(
+            'permissive',
+            node.path_kwargs.get('soft_fail', False))
+
+    def value_source(self, node):
+        """
+        Return a python expression resolving the path of the given
+        query node on the current row
+        """
+        soft_fail = self.get_soft_fail(node)
+        return (
+            self.path_source(node.path) or
+            self.generic_value_source(node.path, soft_fail))
+
+    def path_source(self, path):
+        """
+        Return a python expression accessing the given path directly on the
+        current row, or None if the sample row does not allow it
+        """
+        result = self.walk_path(path, allow_loops=False)
+        if result is None:
+            return None
+        return result[0]
+
+    def iterable_source(self, path):
+        """
+        For paths going through lists, such as ``tags.name``, return a python
+        expression accessing the final value inside generator loops, and the source of the loops
+        (``"for _i0 in o['tags']"``). Return None for other paths, or if the sample
+        row does not allow it.
+        """
+        result = self.walk_path(path, allow_loops=True)
+        if result is None or not result[1]:
+            return None
+        return result[0], ' '.join(result[1])
+
+    def walk_path(self, path, allow_loops):
+        expression = self.varname
+        value = self.sample
+        loops = []
+        for index, part in enumerate(path.path):
+            while True:
+                try:
+                    resolver = utils.find_resolver(value, part)
+                except Exception:
+                    return None
+                if resolver is not utils.resolve_iterable:
+                    break
+                # We can only guess the structure of lists items from a non empty list
+                if not allow_loops or not isinstance(value, (list, tuple)) or not value:
+                    return None
+                item = '_i{0}'.format(len(loops))
+                loops.append('for {0} in {1}'.format(item, expression))
+                expression = item
+                value = value[0]
+
+            if (index or loops) and not is_plain_value(value, part, resolver):
+                # Properties of related objects may be expensive, the generic
+                # getter only computes them once per related object
+                return None
+            try:
+                resolved = resolver(value, part)
+            except Exception:
+                # The sample does not have this field
+                return None
+            if isinstance(resolved, utils.IterableAttr):
+                return None
+
+            value = resolved
+            if resolver is utils.resolve_item:
+                expression = '{0}[{1!r}]'.format(expression, part)
+            elif IDENTIFIER_REGEX.match(part) and not keyword.iskeyword(part):
+                expression = '{0}.{1}'.format(expression, part)
+            else:
+                expression = 'getattr({0}, {1!r})'.format(expression, part)
+        return expression, loops
+
+    def lookup_source(self, node):
+        """
+        Return a python expression applying the lookup of the given
+        query node on the current row
+        """
+        lookup = node.lookup
+        if isinstance(lookup, lookups.test) and lookup.wraps_lookup():
+            lookup = lookup.test
+        if type(lookup) is lookups.eq:
+            # Equality is the only lookup supported on lists by the generic implementation
+            nested = self.iterable_source(node.path)
+            if nested is not None:
+                value, loops = nested
+                return 'any({0} {1})'.format(node.lookup.to_source(value, self), loops)
+        return node.lookup.to_source(self.value_source(node), self)
+
+    def generic_value_source(self, path, soft_fail):
+        # The memo is given to the factory, so compiled code can be reused by other queries
+        getter = lambda obj, memo: store.path_to_value(obj, path, soft_fail=soft_fail, memo=memo)
+        return '{0}({1}, _memo)'.format(self.add_constant(getter), self.varname)
+
+
+def get_factory(expression, constants_count):
+    """
+    Compile a factory of functions returning the given expression on a row. Factories only
+    depend on the query structure, not on the queried values,
+    so they are cached and reused accross queries.
+    """
+    arguments = ['_fallback', '_type', '_memo'] + [
+        '_c{0}'.format(i) for i in range(constants_count)]
+    source = PREDICATE_TEMPLATE.format(
+        arguments=', '.join(arguments),
+        expression=expression)
+
+    try:
+        return _factories[source]
+    except KeyError:
+        pass
+
+    namespace = {'_errors': FALLBACK_ERRORS}
+    exec(compile(source, '<lifter query>', 'exec'), namespace)
+    factory = namespace['factory']
+
+    if len(_factories) >= FACTORIES_CACHE_SIZE:
+        _factories.clear()
+    _factories[source] = factory
+    return factory
+
+
+def compile_getter(path, sample, soft_fail=False):
+    """
+    Return a function returning the value at the given path on a single row.
+
+    :param sample: a row from the queried values, used to decide how to access values
+    """
+    memo = {}
+    fallback = lambda obj: store.path_to_value(obj, path, soft_fail=soft_fail, memo=memo)
+    expression = Compiler(sample, hints={}).path_source(path)
+    if expression is None:
+        return fallback
+    factory = get_factory(expression, 0)
+    return factory(fallback, type(sample), memo)
+
+
+def compile_key(paths, sample, soft_fail=False):
+    """
+    Return a function returning the tuple of values at the given paths on
+    a single row, in a single call. Used as a sort key for multiple orderings.
+    """
+    memo = {}
+    fallback = lambda obj: tuple(
+        store.path_to_value(obj, path, soft_fail=soft_fail, memo=memo)
+        for path in paths)
+    compiler = Compiler(sample, hints={})
+    sources = [
+        compiler.path_source(path) or compiler.generic_value_source(path, soft_fail)
+        for path in paths]
+    expression = '({0},)'.format(', '.join(sources))
+    factory = get_factory(expression, len(compiler.constants))
+    return factory(fallback, type(sample), memo, *compiler.constants)
+
+
+def compile_filters_factory(node, hints, sample):
+    """
+    Return a function building, from a fallback and a memo, functions
+    testing a single row against the given query node. It holds no row,
+    so it can be reused by other queries with the same structure.
+
+    :param sample: a row from the queried values, used to decide how to access values
+    """
+    compiler = Compiler(sample, hints=hints)
+    expression = node.to_source(compiler)
+    factory = get_factory(expression, len(compiler.constants))
+    row_type = type(sample)
+    constants = compiler.constants
+    return lambda fallback, memo: factory(fallback, row_type, memo, *constants)
+
+
+def compile_filters(node, hints, sample, fallback, memo=None):
+    """
+    Return a function testing a single row against the given query node.
+
+    :param sample: a row from the queried values, used to decide how to access values
+    :param fallback: a function implementing the same test without assumptions
+        on the row structure
+    :param memo: the dict remembering values resolved on related objects,
+        it must not outlive the current query
+    """
+    build = compile_filters_factory(node, hints=hints, sample=sample)
+    return build(fallback, {} if memo is None else memo)
+
+
+class NotCompilable(Exception):
+    pass
+
+
+# Lookups emitting plain comparisons, that numba can compile
+KERNEL_LOOKUPS = (
+    lookups.eq, lookups.ne, lookups.gt, lookups.gte,
+    lookups.lt, lookups.lte, lookups.value_range)
+
+# numpy dtype kinds of the columns we can pass to kernels
+KERNEL_COLUMN_KINDS = 'biuf'
+
+
+def is_kernel_scalar(value):
+    if isinstance(value, bool) or isinstance(value, float):
+        return True
+    # larger integers would be rounded when compared to float columns
+    bound = lookups.FLOAT_EXACT_BOUND
+    return isinstance(value, six.integer_types) and -bound <= value <= bound
+
+
+class KernelCompiler(Compiler):
+    """
+    Generate the source of a numba kernel evaluating a query
+    on numeric numpy columns, see :py:mod:`lifter._numba_kernels`
+    """
+    varname = 'i'
+
+    def __init__(self, columns):
+        super(KernelCompiler, self).__init__(sample=None, hints={})
+        self.columns = columns
+        self.column_names = {}
+
+    def add_constant(self, value):
+        if not is_kernel_scalar(value):
+            raise NotCompilable(value)
+        return super(KernelCompiler, self).add_constant(value)
+
+    def add_column(self, key):
+        try:
+            return self.column_names[key]
+        except KeyError:
+            pass
+        column = self.columns.get(key)
+        if column is None or column.dtype.kind not in KERNEL_COLUMN_KINDS:
+            raise NotCompilable(key)
+        name = self.column_names[key] = super(KernelCompiler, self).add_constant(column)
+        return name
+
+    def iterable_source(self, path):
+        return None
+
+    def value_source(self, node):
+        lookup = node.lookup
+        if isinstance(lookup, lookups.test) and lookup.wraps_lookup():
+            lookup = lookup.test
+        if type(lookup) not in KERNEL_LOOKUPS or len(node.path.path) != 1:
+            raise NotCompilable(node)
+        return '{0}[{1}]'.format(self.add_column(node.path.path[0]), self.varname)
+
+
+def compile_kernel(node, columns):
+    """
+    Return a function filling the given boolean numpy array with the result
+    of the given query node for each row, or None if the query cannot be
+    compiled to a numba kernel (numba is not installed, non numeric columns...)
+    """
+    compiler = KernelCompiler(columns)
+    try:
+        expression = node.to_source(compiler)
+    except NotCompilable:
+        return None
+    kernel = _numba_kernels.get_filter_kernel(expression, len(compiler.constants))
+    if kernel is None:
+        return None
+
+    constants = compiler.constants
+    return lambda out: kernel(out, *constants)
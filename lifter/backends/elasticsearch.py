@@ -73,6 +73,7 @@ class ES2QueryStringBuilder(http.QueryStringBuilder):
     """
     Compile query filters to ES2 required format
     """
+    __slots__ = ()
 
     support_table = {
         'lookups': [
@@ -1,4 +1,7 @@
+import collections
+
 import requests
+from requests.adapters import HTTPAdapter, Retry
 
 from .. import __version__
 from .. import store
@@ -10,10 +13,40 @@ from .. import utils
 class RESTStore(store.Store):
 
     def __init__(self, *args, **kwargs):
-        self._session = kwargs.pop('session', None) or requests.Session()
+        session = kwargs.pop('session', None)
+        pool_kwargs = {
+            'pool_connections': kwargs.pop('pool_connections', 10),
+            'pool_maxsize': kwargs.pop('pool_maxsize', 32),
+            'max_retries': kwargs.pop('max_retries', None),
+        }
+        self._session = session or self.get_session(**pool_kwargs)
         self.base_url = kwargs.pop('base_url')
         super(RESTStore, self).__init__(*args, **kwargs)
 
+    def get_session(self, pool_connections, pool_maxsize, max_retries=None):
+        """
+        Build a session that keeps connections alive and reuses them
+        across queries
+        """
+        if max_retries is None:
+            max_retries = Retry(
+                total=3,
+                backoff_factor=0.1,
+                status_forcelist=[502, 503, 504],
+                # return the last response so that HTTP errors are
+                # handled in parse_response
+                raise_on_status=False,
+            )
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=max_retries,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
     @property
     def session(self):
         return self._session
@@ -88,7 +121,7 @@ class RESTStore(store.Store):
             if response.status_code >= 500:
                 raise exceptions.StoreError(str(e))
         parser = self.get_parser(response)
-        return parser.parse(response.content.decode('utf-8'))
+        return parser.parse_response(response)
 
     def get_parser(self, response):
         # if response.headers['Content-Type'] in ['application/javascript', 'application/json']:
@@ -104,6 +137,26 @@ class RESTStore(store.Store):
         parsed_response = self.parse_response(response)
         return self.get_results(parsed_response, query)
 
+    def handle_select_many(self, queries, model, max_workers=8):
+        """
+        Execute the given select queries concurrently, reusing the session
+        connection pool. Results are returned in the same order as queries.
+        """
+        # Not available on python 2 without the futures backport
+        from concurrent.futures import ThreadPoolExecutor
+
+        requests_to_send = [
+            self.build_request(self.build_query_url(query, model), query, model)
+            for query in queries
+        ]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = list(executor.map(self.get_response, requests_to_send))
+
+        return [
+            self.get_results(self.parse_response(response), query)
+            for query, response in zip(queries, responses)
+        ]
+
     def handle_count(self, query, model):
         query = query.clone(action='select')
         return len(self.handle_select(query, model))
@@ -113,6 +166,7 @@ class QueryStringBuilder(object):
     """
     Will build the correct querystring from a given query node
     """
+    __slots__ = ()
 
     def check_support(self, node):
         if node.inverted and 'NOT' not in self.support_table['operators']:
@@ -136,6 +190,7 @@ class QueryStringBuilder(object):
         return r
 
 class SimpleQueryStringBuilder(QueryStringBuilder):
+    __slots__ = ()
 
     support_table = {
         'lookups': [
@@ -147,20 +202,24 @@ class SimpleQueryStringBuilder(QueryStringBuilder):
     }
 
     def get_filters_as_dict(self, node):
-        d = {}
+        d = collections.defaultdict(list)
 
         for key, value in self.iterate(node):
-            l = d.setdefault(key, [])
-            l.append(value)
+            d[key].append(value)
 
-        return d
+        return dict(d)
 
     def iterate(self, node):
-        self.check_support(node)
-        try:
-            for sq in node.subqueries:
-                for r in self.iterate(sq):
-                    yield r
-        except AttributeError:
-            # Leaf query
-            yield str(node.path), node.lookup.reference_value
+        # We use an explicit stack instead of recursion, so deeply nested
+        # queries do not hit the recursion limit
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            self.check_support(node)
+            subqueries = getattr(node, 'subqueries', None)
+            if subqueries is None:
+                # Leaf query
+                yield str(node.path), node.lookup.reference_value
+            else:
+                # reversed, to yield subqueries in their original order
+                stack.extend(reversed(subqueries))
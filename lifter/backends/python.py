@@ -1,6 +1,18 @@
+import heapq
+import itertools
 import operator
+import random
+
+import six
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from . import base
+from . import compiler
+from .. import aggregates
 from .. import query
 from .. import models
 from .. import store
@@ -10,11 +22,38 @@ from .. import utils
 from .. import managers
 
 
-def get_wrapper(query, hints):
+# Values that can be stored in a numpy column by ColumnarStore
+COLUMN_TYPES = set(six.integer_types + six.string_types + (float, bool, type(None)))
+
+# Factories of compiled filters, by query structure, row type and permissive
+# hint, so queries built again and again are only compiled once
+_compiled_filters = {}
+COMPILED_FILTERS_CACHE_SIZE = 256
+
+
+def is_native_column(values, value_type):
+    """
+    Return True if the given values, all of the given type, keep
+    python comparison semantics once stored in a typed numpy array
+    """
+    if value_type is type(None):
+        return False
+    if value_type in six.integer_types:
+        # integer columns are converted to floats to be compared to floats
+        bound = lookups.FLOAT_EXACT_BOUND
+        return all(-bound <= v <= bound for v in values)
+    if value_type in (six.text_type, six.binary_type):
+        # numpy strings drop trailing NUL characters
+        nul = u'\x00' if value_type is six.text_type else b'\x00'
+        return not any(v.endswith(nul) for v in values)
+    return True
+
+
+def get_wrapper(query, hints, memo=None):
     inverted = query.inverted
     subqueries = [
-        QueryImpl(subquery, hints=hints)
-        for subquery in query.subqueries]
+        QueryImpl(subquery, hints=hints, memo=memo)
+        for subquery in query.ordered_subqueries()]
 
     if query.operator == 'AND':
         matcher = all
@@ -31,24 +70,28 @@ def get_wrapper(query, hints):
 
 class QueryImpl(object):
 
-    def __init__(self, base_query, hints):
+    def __init__(self, base_query, hints, memo=None):
         self.base_query = base_query
         self.hints = hints
+        # Values resolved on related objects, shared by all the nodes of the query
+        self.memo = {} if memo is None else memo
         self.test = self.setup_test()
 
     def setup_test(self):
-        try:
+        if hasattr(self.base_query, 'subqueries'):
             # query wrapper
-            return get_wrapper(self.base_query, hints=self.hints)
-        except AttributeError:
+            return get_wrapper(self.base_query, hints=self.hints, memo=self.memo)
+        else:
             # Leaf query
             lookup = self.base_query.lookup
             inverted = self.base_query.inverted
             soft_fail = self.hints.get(
                 'permissive',
                 self.base_query.path_kwargs.get('soft_fail', False))
+            path = self.base_query.path
+            memo = self.memo
             def leaf_query(obj):
-                value = store.path_to_value(obj, self.base_query.path, soft_fail=soft_fail)
+                value = store.path_to_value(obj, path, soft_fail=soft_fail, memo=memo)
                 result = lookup.lookup(value)
                 if inverted:
                     return not result
@@ -77,19 +120,48 @@ class IterableStore(store.Store):
         return None
 
 
-    def get_values(self, query):
-        compiled_filters = None
-        if query.filters:
-            compiled_filters = QueryImpl(query.filters, hints=query.hints)
+    def compile_filters(self, query, sample):
+        """
+        Return a function testing a single row against the query filters,
+        using the given row to guess how values should be accessed
+        """
+        key = query.filters.get_cache_key()
+        build = None
+        if key is not None:
+            key = (key, type(sample), query.hints.get('permissive'))
+            build = _compiled_filters.get(key)
+
+        if build is None:
+            build = compiler.compile_filters_factory(
+                query.filters, hints=query.hints, sample=sample)
+            if key is not None:
+                if len(_compiled_filters) >= COMPILED_FILTERS_CACHE_SIZE:
+                    _compiled_filters.clear()
+                _compiled_filters[key] = build
+
+        # Each query gets its own memo, so values resolved on related
+        # objects are not shared with other iterations
+        memo = {}
+        fallback = QueryImpl(query.filters, hints=query.hints, memo=memo)
+        return build(fallback, memo)
 
-        if not compiled_filters:
+    def get_values(self, query):
+        if not query.filters:
             for obj in self.values:
                 yield obj
+            return
+
+        iterator = iter(self.values)
+        for first in iterator:
+            break
         else:
-            for obj in self.values:
-                if compiled_filters(obj):
-                    yield obj
-        # return filter(self.query, self._iter_data)
+            # No values
+            return
+
+        compiled_filters = self.compile_filters(query, sample=first)
+        for obj in itertools.chain([first], iterator):
+            if compiled_filters(obj):
+                yield obj
 
     def select_single(self, iterator):
         first_match = None
@@ -105,6 +177,48 @@ class IterableStore(store.Store):
 
         return first_match
 
+    def sort(self, values, orderings, limit=None):
+        """
+        Sort the given list, in place when possible, and return the sorted values. Consecutive orderings in
+        the same direction are applied in a single sort, using tuple keys.
+
+        :param limit: if given, only the first ``limit`` values
+            of the sorted list are needed
+        """
+        groups = []
+        for ordering in orderings:
+            previous = groups[-1][-1] if groups else None
+            if (previous and not previous.random and not ordering.random and
+                    previous.reverse == ordering.reverse):
+                groups[-1].append(ordering)
+            else:
+                groups.append([ordering])
+
+        if limit is not None and len(groups) == 1 and not orderings[0].random:
+            # Selecting a few values with a heap is faster than sorting everything,
+            # but not when we need a large part of the values
+            if values and limit * 4 <= len(values):
+                key = self.get_sort_key(groups[0], sample=values[0])
+                if orderings[0].reverse:
+                    return heapq.nlargest(limit, values, key=key)
+                return heapq.nsmallest(limit, values, key=key)
+
+        # We sort from the least significant group, relying on sort stability
+        for group in reversed(groups):
+            if not values:
+                break
+            if group[0].random:
+                values.sort(key=lambda v: random.random())
+                continue
+            key = self.get_sort_key(group, sample=values[0])
+            values.sort(key=key, reverse=group[0].reverse)
+        return values
+
+    def get_sort_key(self, orderings, sample):
+        if len(orderings) == 1:
+            return compiler.compile_getter(orderings[0].path, sample=sample)
+        return compiler.compile_key([o.path for o in orderings], sample=sample)
+
     def handle_exists(self, query, model):
         iterator = self.handle_select(query.clone(orderings=None), model)
         for row in iterator:
@@ -121,17 +235,12 @@ class IterableStore(store.Store):
         if query.hints.get('force_single', False):
             return [self.select_single(iterator)]
         if query.orderings:
-            random_value = lambda v: random.random()
-
-            for ordering in reversed(query.orderings):
-                # We loop in reverse order because we found no other way to handle multiple sorting
-                # in different directions right now
-
-                if ordering.random:
-                    iterator = sorted(iterator, key=random_value)
-                    continue
-                l = lambda v: store.path_to_value(v, ordering.path)
-                iterator = sorted(iterator, key=l, reverse=ordering.reverse)
+            limit = None
+            window = query.window
+            if window and not query.hints.get('distinct', False) and window.start_as_int >= 0 and window.stop > 0:
+                # Rows after the end of the window are dropped anyway
+                limit = window.stop
+            iterator = self.sort(list(iterator), query.orderings, limit=limit)
 
         if query.hints.get('distinct', False):
             iterator = utils.unique_everseen(iterator)
@@ -142,25 +251,41 @@ class IterableStore(store.Store):
     def handle_values(self, query, model):
         return self.handle_select(query, model)
 
-    def collect_values(self, data, aggregates):
+    def collect_values(self, data, aggregations):
+        # Aggregates on the same path share the same values,
+        # so each path is resolved only once per row
+        paths = {}
         r = {}
-        for row in data:
-            for key, aggregate in aggregates:
-                l = r.setdefault(key, [])
-                l.append(store.path_to_value(row, aggregate.path))
+        for key, aggregation in aggregations:
+            path_key = tuple(aggregation.path.path)
+            if path_key not in paths:
+                paths[path_key] = (aggregation.path, [])
+            r[key] = paths[path_key][1]
+
+        iterator = iter(data)
+        for first in iterator:
+            break
+        else:
+            return r
+
+        getters = [
+            (compiler.compile_getter(path, sample=first), values)
+            for path, values in paths.values()]
+        for row in itertools.chain([first], iterator):
+            for getter, values in getters:
+                values.append(getter(row))
         return r
 
     def handle_aggregate(self, query, model):
         data = self.handle_select(query, model)
-        values = self.collect_values(data, query.hints['aggregates'])
+        aggregations = query.hints['aggregates']
+        values = self.collect_values(data, aggregations)
+        results = aggregates.aggregate_columns(values, aggregations)
         if query.hints.get('flat', False):
-            return [
-                aggregate.aggregate(values[key])
-                for key, aggregate in query.hints['aggregates']
-            ]
+            return results
         return {
-            key: aggregate.aggregate(values[key])
-            for key, aggregate in query.hints['aggregates']
+            key: result
+            for (key, aggregation), result in zip(aggregations, results)
         }
 
 
@@ -182,3 +307,200 @@ class DummyStore(store.Store):
         """
         values = self.load(model, adapter)
         return IterableStore(values=values)._execute(query, model=model, adapter=None, raw=raw)
+
+
+def pack_mask(mask):
+    """
+    Pack a boolean numpy array as bits in an array of uint64 words.
+    Trailing bits of the last word are undefined.
+    """
+    packed = numpy.packbits(mask, bitorder='little')
+    padding = -len(packed) % 8
+    if padding:
+        packed = numpy.concatenate([packed, numpy.zeros(padding, dtype=numpy.uint8)])
+    return packed.view(numpy.uint64)
+
+
+def unpack_mask(packed, size):
+    """Return the boolean numpy array of the given size packed by :py:func:`pack_mask`"""
+    return numpy.unpackbits(packed.view(numpy.uint8), count=size, bitorder='little').view(bool)
+
+
+class ColumnarStore(IterableStore):
+    """
+    An :py:class:`IterableStore` for lists of dictionaries sharing the same keys.
+
+    Scalar values are also stored column by column, in numpy arrays, so filters on
+    top-level fields are evaluated on whole columns at once instead of row by row.
+    Filters that cannot be vectorized (related lookups, callables...) are
+    evaluated row by row, and only on rows that may still match.
+
+    Columns are built when the store is created: changes made to the
+    dictionaries afterwards are not visible to vectorized filters.
+    Without numpy, or with heterogeneous rows, the store behaves
+    exactly as an :py:class:`IterableStore`.
+
+    Fields holding mixed types, integers too large to be compared exactly to
+    floats or strings ending with NUL characters are stored in object
+    arrays, to keep python comparison semantics. Vectorized operands are
+    evaluated on all rows, so lookups that raise on some values
+    are tested row by row, on the rows other operands did not exclude.
+
+    When numba is installed, filters made only of comparisons on numeric
+    fields are compiled to a parallel kernel on large collections.
+    """
+
+    kernel_threshold = 100000
+    """
+    Minimum number of rows to use numba kernels, that take time to compile
+    """
+
+    def __init__(self, values, *args, **kwargs):
+        values = list(values)
+        super(ColumnarStore, self).__init__(values, *args, **kwargs)
+        self.columns = self.build_columns(values)
+        self.lowered_columns = {}
+
+    def build_columns(self, values):
+        if numpy is None or not values:
+            return {}
+
+        keys = None
+        for row in values:
+            if type(row) is not dict:
+                return {}
+            if keys is None:
+                keys = set(row)
+            elif len(row) != len(keys) or not keys.issuperset(row):
+                return {}
+
+        columns = {}
+        for key in keys:
+            column = [row[key] for row in values]
+            types = set(type(v) for v in column)
+            if not types.issubset(COLUMN_TYPES):
+                # nested data, objects... we cannot store those in a column
+                continue
+            if len(types) == 1 and is_native_column(column, types.pop()):
+                columns[key] = numpy.array(column)
+            else:
+                # mixed types, large integers... we keep python semantics for comparisons
+                array = numpy.empty(len(column), dtype=object)
+                array[:] = column
+                columns[key] = array
+        return columns
+
+    def get_column(self, node):
+        if len(node.path.path) != 1:
+            return None
+        key = node.path.path[0]
+        column = self.columns.get(key)
+        if column is None or not node.lookup.case_insensitive:
+            return column
+        if column.dtype.kind not in 'SU':
+            return None
+
+        # Lowered once, and reused by all case insensitive lookups
+        try:
+            return self.lowered_columns[key]
+        except KeyError:
+            lowered = self.lowered_columns[key] = numpy.char.lower(column)
+            return lowered
+
+    def get_leaf_mask(self, node):
+        column = self.get_column(node)
+        if column is None:
+            return None
+        try:
+            mask = node.lookup.vectorize(column)
+        except TypeError:
+            # Such as None compared to numbers in an object column: rows are
+            # tested one by one, only if other operands did not exclude them
+            return None
+        if not isinstance(mask, numpy.ndarray) or mask.shape != column.shape:
+            # Some numpy versions return a single value for unsupported comparisons
+            return None
+        mask = pack_mask(mask)
+        if node.inverted:
+            return ~mask
+        return mask
+
+    def get_packed_mask(self, node, hints, nested=False):
+        """
+        Same as :py:meth:`get_mask`, with rows packed as bits in uint64 words,
+        so combining masks handles 64 rows per operation
+
+        :param nested: if True, return None instead of testing rows one by one,
+            so the parent node only tests the rows its other operands did not exclude
+        """
+        if not hasattr(node, 'subqueries'):
+            return self.get_leaf_mask(node)
+
+        is_and = node.operator == 'AND'
+        mask = None
+        row_subqueries = []
+        for subquery in node.subqueries:
+            subquery_mask = self.get_packed_mask(subquery, hints, nested=True)
+            if subquery_mask is None:
+                row_subqueries.append(subquery)
+            elif mask is None:
+                mask = subquery_mask.copy()
+            elif is_and:
+                mask &= subquery_mask
+            else:
+                mask |= subquery_mask
+
+        if mask is None or (row_subqueries and nested):
+            return None
+
+        if row_subqueries:
+            # We only test rows whose result is not known yet
+            row_query = query.QueryNodeWrapper(node.operator, *row_subqueries)
+            test = compiler.compile_filters(
+                row_query, hints=hints, sample=self.values[0],
+                fallback=QueryImpl(row_query, hints=hints))
+            unpacked = unpack_mask(mask, len(self.values))
+            candidates = numpy.flatnonzero(unpacked if is_and else ~unpacked)
+            for index in candidates.tolist():
+                unpacked[index] = test(self.values[index])
+            mask = pack_mask(unpacked)
+
+        if node.inverted:
+            return ~mask
+        return mask
+
+    def get_mask(self, node, hints):
+        """
+        Return a boolean numpy array, telling for each row if it matches
+        the given query node, or None if the node cannot be vectorized
+        """
+        mask = self.get_packed_mask(node, hints)
+        if mask is None:
+            return None
+        return unpack_mask(mask, len(self.values))
+
+    def get_kernel_mask(self, node):
+        """
+        Evaluate the given query node in a single parallel pass with numba,
+        if all its lookups are comparisons on numeric columns.
+        Return None otherwise.
+        """
+        kernel = compiler.compile_kernel(node, self.columns)
+        if kernel is None:
+            return None
+        mask = numpy.empty(len(self.values), dtype=bool)
+        kernel(mask)
+        return mask
+
+    def get_values(self, query):
+        mask = None
+        if query.filters and self.columns:
+            if len(self.values) >= self.kernel_threshold:
+                mask = self.get_kernel_mask(query.filters)
+            if mask is None:
+                mask = self.get_mask(query.filters, query.hints)
+        if mask is None:
+            return super(ColumnarStore, self).get_values(query)
+
+        values = self.values
+        return (values[index] for index in numpy.flatnonzero(mask).tolist())
@@ -1,7 +1,11 @@
 """
 Cache yo.
 """
-import datetime
+try:
+    from time import monotonic as _now
+except ImportError:
+    # python 2
+    from time import time as _now
 
 from . import exceptions
 
@@ -10,6 +14,8 @@ class NotSet(object):
 
 
 class Enable(object):
+    __slots__ = ('cache', 'new_value', 'previous_value')
+
     def __init__(self, cache, new_value):
         self.cache = cache
         self.new_value = new_value
@@ -23,6 +29,8 @@ class Enable(object):
 
 
 class Cache(object):
+    __slots__ = ('default_timeout', 'enabled')
+
     def __init__(self, default_timeout=None, enabled=True):
         self.default_timeout = default_timeout
         self.enabled = enabled
@@ -67,7 +75,7 @@ class Cache(object):
                 raise
             return default
 
-    def set(self, key, value, timeout=NotSet):
+    def set(self, key, value=NotSet, timeout=NotSet, factory=None):
         """
         Set the given key to the given value in the cache.
         A timeout may be provided, otherwise, the :py:attr:`Cache.default_timeout`
@@ -78,6 +86,8 @@ class Cache(object):
         :param value: the value to store in the cache
         :param timeout: the expiration delay for the value. None means it will never expire.
         :type timeout: integer or None
+        :param factory: a callable, that will be called to get the value to store
+            if no value is provided
 
         Example usage:
 
@@ -85,22 +95,32 @@ class Cache(object):
 
             # this cached value will expire after half an hour
             cache.set('my_key', 'value', 1800)
+
+            # the value is computed only if the cache is enabled
+            cache.set('my_key', factory=compute_value)
         """
+        if value is NotSet and factory is None:
+            raise ValueError('You must provide either a value or a factory')
+
         if not self.enabled:
             return
 
-        if hasattr(value, '__call__'):
-            value = value()
-        if timeout == NotSet:
+        if factory is not None:
+            value = factory()
+        if timeout is NotSet:
             timeout = self.default_timeout
         self._set(key, value, timeout)
         return value
 
-    def get_or_set(self, key, value):
+    def get_or_set(self, key, value=NotSet, timeout=NotSet, factory=None):
+        """
+        Get the given key from the cache, or set it using :py:meth:`Cache.set`
+        if it is not present
+        """
         try:
             return self.get(key, reraise=True)
         except exceptions.NotInCache:
-            return self.set(key, value)
+            return self.set(key, value, timeout=timeout, factory=factory)
 
     def enable(self):
         """
@@ -127,7 +147,11 @@ class Cache(object):
 
 
     def get_now(self):
-        return datetime.datetime.now()
+        """
+        Return the current time, as a float number of seconds. Only the difference
+        between two values is meaningful.
+        """
+        return _now()
 
     def _get(self, key):
         raise NotImplementedError()
@@ -138,13 +162,15 @@ class Cache(object):
 
 
 class DummyCache(Cache):
+    __slots__ = ('_data',)
+
     def __init__(self, *args, **kwargs):
         self._data = {}
         super(DummyCache, self).__init__(*args, **kwargs)
 
     def _set(self, key, value, timeout=None):
         if timeout is not None:
-            expires_on = self.get_now() + datetime.timedelta(seconds=timeout)
+            expires_on = self.get_now() + timeout
         else:
             expires_on = None
         self._data[key] = (expires_on, value)
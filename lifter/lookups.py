@@ -1,5 +1,44 @@
 import persisting_theory
 import operator
+import six
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Reference values that can be compared to a whole numpy column at once
+SCALAR_TYPES = six.integer_types + six.string_types + (float, bool, type(None))
+
+# Reference values whose hash is consistent with equality
+HASHABLE_TYPES = six.integer_types + six.string_types + (float, type(None))
+
+# Above this number of values, value_in uses numpy.isin on columns
+ISIN_THRESHOLD = 8
+
+# Integers above this bound may be rounded when converted to floats
+FLOAT_EXACT_BOUND = 2 ** 53
+
+def is_column_scalar(column, value):
+    """
+    Return True if comparing the given column to the given value with numpy
+    gives the same result as comparing each value of the column in python
+    """
+    if not isinstance(value, SCALAR_TYPES):
+        return False
+    # numpy converts integers to floats to compare them to float columns
+    return not (
+        column.dtype.kind == 'f' and isinstance(value, six.integer_types) and
+        abs(value) > FLOAT_EXACT_BOUND)
+
+def is_string_column(column, value):
+    """
+    Return True if numpy string functions can be applied on the given
+    column with the given string
+    """
+    if not isinstance(value, six.string_types):
+        return False
+    return column.dtype.kind == ('U' if isinstance(value, six.text_type) else 'S')
 
 class Lookups(persisting_theory.Registry):
     def prepare_name(self, data, name):
@@ -11,12 +50,48 @@ register = registry.register
 
 
 class BaseLookup(object):
+    selectivity_rank = 1
+    """
+    Lookups that cannot raise, whatever the value, have a rank of 0 and are
+    evaluated first among consecutive operands on the same path, see
+    :py:func:`lifter.query.order_operands`. Other lookups keep the order given
+    by the user, since they may rely on previous operands as guards
+    (such as ``filter(T.v != None, T.v > 3)``).
+    """
+
     def __call__(self, value):
         return self.lookup(value)
 
     def lookup(self, value):
         raise NotImplementedError
 
+    def to_source(self, value, compiler):
+        """
+        Return a python expression applying the lookup on the given value
+        expression. Defaults to calling :py:meth:`lookup`, subclasses may
+        emit inline code instead.
+        """
+        return '{0}({1})'.format(compiler.add_constant(self.lookup), value)
+
+    def get_cache_key(self):
+        """
+        Return a hashable value identifying the lookup and its arguments,
+        or None if it cannot be used to reuse compiled queries
+        """
+        return None
+
+    case_insensitive = False
+    """
+    If True, :py:meth:`vectorize` receives columns with lowercased strings
+    """
+
+    def vectorize(self, column):
+        """
+        Apply the lookup on a whole numpy column at once, returning a boolean
+        numpy array, or None if the lookup cannot be vectorized
+        """
+        return None
+
 class OneValueLookup(BaseLookup):
     operator = None
     def __init__(self, value):
@@ -28,24 +103,56 @@ class OneValueLookup(BaseLookup):
     def __hash__(self):
         return hash((self.operator, self.reference_value))
 
+    def get_cache_key(self):
+        value = self.reference_value
+        key = (type(self), type(value), value)
+        try:
+            hash(key)
+        except TypeError:
+            # lists, for instance
+            return None
+        return key
+
 @register(name='eq')
 class eq(OneValueLookup):
+    selectivity_rank = 0
     operator = '=='
     def lookup(self, value):
         return value == self.reference_value
 
+    def to_source(self, value, compiler):
+        return '{0} == {1}'.format(value, compiler.add_constant(self.reference_value))
+
+    def vectorize(self, column):
+        if is_column_scalar(column, self.reference_value):
+            return column == self.reference_value
+
 @register(name='ne')
 class ne(OneValueLookup):
     operator = '!='
     def lookup(self, value):
         return value != self.reference_value
 
+    def to_source(self, value, compiler):
+        return '{0} != {1}'.format(value, compiler.add_constant(self.reference_value))
+
+    def vectorize(self, column):
+        if is_column_scalar(column, self.reference_value):
+            return column != self.reference_value
+
 @register(name='gt')
 class gt(OneValueLookup):
     operator = '>'
     def lookup(self, value):
         return value > self.reference_value
 
+    def to_source(self, value, compiler):
+        return '{0} > {1}'.format(value, compiler.add_constant(self.reference_value))
+
+    def vectorize(self, column):
+        if is_column_scalar(column, self.reference_value):
+            return column > self.reference_value
+
 @register(name='gte')
 class gte(OneValueLookup):
     operator = '>='
@@ -53,66 +160,189 @@ class gte(OneValueLookup):
     def lookup(self, value):
         return value >= self.reference_value
 
+    def to_source(self, value, compiler):
+        return '{0} >= {1}'.format(value, compiler.add_constant(self.reference_value))
+
+    def vectorize(self, column):
+        if is_column_scalar(column, self.reference_value):
+            return column >= self.reference_value
+
 @register(name='lt')
 class lt(OneValueLookup):
     operator = '<'
     def lookup(self, value):
         return value < self.reference_value
 
+    def to_source(self, value, compiler):
+        return '{0} < {1}'.format(value, compiler.add_constant(self.reference_value))
+
+    def vectorize(self, column):
+        if is_column_scalar(column, self.reference_value):
+            return column < self.reference_value
+
 @register(name='lte')
 class lte(OneValueLookup):
     operator = '<='
     def lookup(self, value):
         return value <= self.reference_value
 
+    def to_source(self, value, compiler):
+        return '{0} <= {1}'.format(value, compiler.add_constant(self.reference_value))
+
+    def vectorize(self, column):
+        if is_column_scalar(column, self.reference_value):
+            return column <= self.reference_value
+
 @register(name='startswith')
 class startswith(OneValueLookup):
     operator = 'startswith'
     def lookup(self, value):
         return value.startswith(self.reference_value)
 
+    def to_source(self, value, compiler):
+        return '{0}.startswith({1})'.format(value, compiler.add_constant(self.reference_value))
+
+    def vectorize(self, column):
+        if is_string_column(column, self.reference_value):
+            return numpy.char.startswith(column, self.reference_value)
+
 @register(name='istartswith')
 class istartswith(OneValueLookup):
     operator = 'istartswith'
+    case_insensitive = True
     def lookup(self, value):
         return value.lower().startswith(self.reference_value.lower())
 
+    def to_source(self, value, compiler):
+        return '{0}.lower().startswith({1})'.format(value, compiler.add_constant(self.reference_value.lower()))
+
+    def vectorize(self, column):
+        if is_string_column(column, self.reference_value):
+            return numpy.char.startswith(column, self.reference_value.lower())
+
 @register(name='endswith')
 class endswith(OneValueLookup):
     operator = 'endswith'
     def lookup(self, value):
         return value.endswith(self.reference_value)
 
+    def to_source(self, value, compiler):
+        return '{0}.endswith({1})'.format(value, compiler.add_constant(self.reference_value))
+
+    def vectorize(self, column):
+        if is_string_column(column, self.reference_value):
+            return numpy.char.endswith(column, self.reference_value)
+
 @register(name='iendswith')
 class iendswith(OneValueLookup):
     operator = 'iendswith'
+    case_insensitive = True
     def lookup(self, value):
         return value.lower().endswith(self.reference_value.lower())
 
+    def to_source(self, value, compiler):
+        return '{0}.lower().endswith({1})'.format(value, compiler.add_constant(self.reference_value.lower()))
+
+    def vectorize(self, column):
+        if is_string_column(column, self.reference_value):
+            return numpy.char.endswith(column, self.reference_value.lower())
+
 @register(name='contains')
 class contains(OneValueLookup):
     operator = 'contains'
     def lookup(self, value):
         return self.reference_value in value
 
+    def to_source(self, value, compiler):
+        return '{0} in {1}'.format(compiler.add_constant(self.reference_value), value)
+
+    def vectorize(self, column):
+        if is_string_column(column, self.reference_value):
+            return numpy.char.find(column, self.reference_value) >= 0
+
 @register(name='icontains')
 class icontains(OneValueLookup):
     operator = 'icontains'
+    case_insensitive = True
     def lookup(self, value):
         return self.reference_value.lower() in value.lower()
 
+    def to_source(self, value, compiler):
+        return '{0} in {1}.lower()'.format(compiler.add_constant(self.reference_value.lower()), value)
+
+    def vectorize(self, column):
+        if is_string_column(column, self.reference_value):
+            return numpy.char.find(column, self.reference_value.lower()) >= 0
+
 @register(name='value_in')
 class value_in(OneValueLookup):
     operator = 'in'
+
+    @property
+    def selectivity_rank(self):
+        # "in" on strings raises TypeError with other values
+        if isinstance(self.reference_value, (list, tuple, set, frozenset)):
+            return 0
+        return 1
+
     def lookup(self, value):
         return value in self.reference_value
 
+    def to_source(self, value, compiler):
+        reference = self.reference_value
+        if isinstance(reference, (list, tuple, set)) and all(
+                isinstance(v, HASHABLE_TYPES) for v in reference):
+            # Hash lookups instead of scanning the list for each row. Other values
+            # may not be hashable, or compare equal with different hashes.
+            # Unhashable row values raise a TypeError, and are handled by the fallback
+            reference = frozenset(reference)
+        return '{0} in {1}'.format(value, compiler.add_constant(reference))
+
+    def vectorize(self, column):
+        if not isinstance(self.reference_value, (list, tuple, set, frozenset)):
+            # strings, for instance, would test for substrings
+            return None
+        if not all(is_column_scalar(column, v) for v in self.reference_value):
+            return None
+        if len(self.reference_value) > ISIN_THRESHOLD:
+            # numpy.array() would coerce a mixed reference to a common type,
+            # making '1' match 1, so only homogeneous references are sorted
+            if column.dtype.kind == 'U':
+                homogeneous = all(isinstance(v, six.text_type) for v in self.reference_value)
+            elif column.dtype.kind in 'iuf':
+                homogeneous = all(
+                    isinstance(v, six.integer_types + (float,)) and not isinstance(v, bool)
+                    for v in self.reference_value
+                )
+            else:
+                homogeneous = False
+            if homogeneous:
+                # sorts values once instead of comparing the column to each of them
+                return numpy.isin(column, numpy.array(list(self.reference_value)))
+        mask = numpy.zeros(len(column), dtype=bool)
+        for v in self.reference_value:
+            mask |= column == v
+        return mask
+
 @register(name='exists')
 class exists(BaseLookup):
+    selectivity_rank = 0
+
     def lookup(self, value):
         from .query import Path
         return value != Path.DoesNotExist
 
+    def to_source(self, value, compiler):
+        from .query import Path
+        return '{0} != {1}'.format(value, compiler.add_constant(Path.DoesNotExist))
+
+    def vectorize(self, column):
+        # Columns are only built for fields present in every row
+        return numpy.ones(len(column), dtype=bool)
+
+    def get_cache_key(self):
+        return (type(self),)
+
     def __hash__(self):
         return hash('exists')
 
@@ -131,12 +361,59 @@ class value_range(OneValueLookup):
     def lookup(self, value):
         return value >= self.start and value <= self.end
 
+    def to_source(self, value, compiler):
+        return '{0} <= {1} <= {2}'.format(
+            compiler.add_constant(self.start), value, compiler.add_constant(self.end))
+
+    def vectorize(self, column):
+        if is_column_scalar(column, self.start) and is_column_scalar(column, self.end):
+            return (column >= self.start) & (column <= self.end)
+
 @register(name='test')
 class test(BaseLookup):
+
     def __init__(self, test, *args, **kwargs):
         self.test = test
         self.args = args
         self.kwargs = kwargs
+        if self.wraps_lookup():
+            self.selectivity_rank = test.selectivity_rank
 
     def lookup(self, value):
         return self.test(value, *self.args, **self.kwargs)
+
+    def to_source(self, value, compiler):
+        if self.wraps_lookup():
+            # path.test(lookups.startswith('a')) is compiled as the wrapped lookup
+            return self.test.to_source(value, compiler)
+        test = compiler.add_constant(self.test)
+        if not self.args and not self.kwargs:
+            return '{0}({1})'.format(test, value)
+        return '{0}({1}, *{2}, **{3})'.format(
+            test, value, compiler.add_constant(self.args), compiler.add_constant(self.kwargs))
+
+    def get_cache_key(self):
+        if self.wraps_lookup():
+            test = self.test.get_cache_key()
+            if test is None:
+                return None
+        else:
+            test = self.test
+        key = (type(self), test, self.args, tuple(sorted(self.kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def wraps_lookup(self):
+        return isinstance(self.test, BaseLookup) and not self.args and not self.kwargs
+
+    @property
+    def case_insensitive(self):
+        return self.wraps_lookup() and self.test.case_insensitive
+
+    def vectorize(self, column):
+        # path.test(lookups.startswith('a')) can be vectorized as the wrapped lookup
+        if self.wraps_lookup():
+            return self.test.vectorize(column)
@@ -3,16 +3,34 @@ import xml.etree.ElementTree as ET
 
 
 class Parser(object):
+    accepts_bytes = False
+    """Whether the parser can handle raw bytes, avoiding a decoding step"""
+
     def parse(self, content):
         raise NotImplementedError()
 
+    def parse_response(self, response):
+        """
+        Parse the body of the given HTTP response
+        """
+        if self.accepts_bytes:
+            return self.parse(response.content)
+        return self.parse(response.content.decode('utf-8'))
+
 
 class JSONParser(Parser):
+    accepts_bytes = True
+
     def parse(self, content):
-        return json.loads(content)
+        try:
+            return json.loads(content)
+        except TypeError:
+            # json.loads does not accept bytes before python 3.6
+            return json.loads(content.decode('utf-8'))
 
 
 class XMLParser(Parser):
+    accepts_bytes = True
     results = './*'
     ns = {}
 
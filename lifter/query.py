@@ -16,7 +16,16 @@ class Path(object):
 
     def __init__(self, path=None):
         self.path = path or []
-        self._getters = []
+        self._getters = None
+
+    def get_getters(self):
+        """
+        Return the functions resolving each part of the path,
+        built once per path instead of on every row
+        """
+        if self._getters is None:
+            self._getters = [utils.attrgetter(part) for part in self.path]
+        return self._getters
 
     def __getattr__(self, part):
         if part.startswith('__'):
@@ -105,6 +114,20 @@ class BaseQueryNode(object):
     def __invert__(self):
         return self.clone(inverted=not self.inverted)
 
+    def to_source(self, compiler):
+        """
+        Return a python expression evaluating the query against a single row,
+        see :py:mod:`lifter.backends.compiler`
+        """
+        raise NotImplementedError()
+
+    def get_cache_key(self):
+        """
+        Return a tuple identifying the structure and values of the query, used
+        to reuse compiled queries, or None if the query cannot be cached
+        """
+        raise NotImplementedError()
+
 class QueryNodeWrapper(BaseQueryNode):
     def __init__(self, operator, *args, **kwargs):
         super(QueryNodeWrapper, self).__init__(**kwargs)
@@ -139,6 +162,33 @@ class QueryNodeWrapper(BaseQueryNode):
     def __hash__(self):
         return hash((self.inverted, self.operator, tuple(self.subqueries)))
 
+    def get_cache_key(self):
+        keys = tuple(sq.get_cache_key() for sq in self.subqueries)
+        if None in keys:
+            return None
+        return (self.operator, self.inverted, keys)
+
+    @property
+    def rank(self):
+        """The highest selectivity rank of the subqueries"""
+        return max([sq.rank for sq in self.subqueries] or [0])
+
+    def ordered_subqueries(self):
+        """Return the subqueries in the order they are evaluated, see :py:func:`order_operands`"""
+        return order_operands(self.subqueries)
+
+    def to_source(self, compiler):
+        if not self.subqueries:
+            expression = 'True' if self.operator == 'AND' else 'False'
+        else:
+            subqueries = self.ordered_subqueries()
+            joiner = ' and ' if self.operator == 'AND' else ' or '
+            expression = joiner.join(sq.to_source(compiler) for sq in subqueries)
+
+        if self.inverted:
+            return '(not ({0}))'.format(expression)
+        return '({0})'.format(expression)
+
 class QueryNode(BaseQueryNode):
     """An abstract way to represent query, that will be compiled to an actual query by the manager"""
     def __init__(self, path, lookup, path_kwargs={}, **kwargs):
@@ -164,6 +214,64 @@ class QueryNode(BaseQueryNode):
             self.lookup,
             self.inverted,
         ))
+
+    def get_cache_key(self):
+        lookup_key = self.lookup.get_cache_key()
+        if lookup_key is None:
+            return None
+        return (
+            tuple(self.path.path),
+            lookup_key,
+            self.inverted,
+            tuple(sorted(self.path_kwargs.items())),
+        )
+
+    @property
+    def rank(self):
+        return self.lookup.selectivity_rank
+
+    def to_source(self, compiler):
+        expression = compiler.lookup_source(self)
+        if self.inverted:
+            return '(not ({0}))'.format(expression)
+        return '({0})'.format(expression)
+
+
+def and_operands(node):
+    """
+    Return the list of nodes that are ANDed together in the given node
+    """
+    if getattr(node, 'operator', None) == 'AND' and not node.inverted:
+        return list(node.subqueries)
+    return [node]
+
+
+def order_operands(nodes):
+    """
+    Return the given operands in evaluation order: among consecutive leaf nodes
+    on the same path, lookups that cannot raise are evaluated first. Other operands
+    keep the order given by the user, since they may guard the resolution
+    of the next paths (such as ``filter(T.parent != None, T.parent.name == 'x')``)
+    """
+    groups = []
+    previous = None
+    for node in nodes:
+        if isinstance(node, QueryNode):
+            current = (tuple(node.path.path), tuple(sorted(node.path_kwargs.items())))
+        else:
+            current = None
+        if current is not None and current == previous:
+            groups[-1].append(node)
+        else:
+            groups.append([node])
+        previous = current
+    # The sort is stable: lookups that may raise keep their order
+    return [
+        node
+        for group in groups
+        for node in sorted(group, key=operator.attrgetter('rank'))]
+
+
 def lookup_to_path(lookup):
     path = Path()
     for part in lookup.replace('__', '.').split('.'):
@@ -310,16 +418,28 @@ class QuerySet(object):
         return self._clone()
 
     def first(self):
-        try:
-            return self.data[0]
-        except IndexError:
-            return None
+        if self._populated:
+            try:
+                return self._data[0]
+            except IndexError:
+                return None
+
+        # We stop at the first result instead of fetching the whole queryset
+        for value in self.iterator():
+            return value
+        return None
 
     def last(self):
-        try:
-            return self.data[-1]
-        except IndexError:
-            return None
+        if self._populated:
+            try:
+                return self._data[-1]
+            except IndexError:
+                return None
+
+        value = None
+        for value in self.iterator():
+            pass
+        return value
 
     def build_filter(self, *args, **kwargs):
         if not args and not kwargs:
@@ -370,7 +490,10 @@ class QuerySet(object):
 
     def _combine_query_filters(self, query):
         if self.query.filters:
-            return query & self.query.filters
+            # We merge chained filters into a single AND node, so they are
+            # evaluated in a single pass
+            subqueries = and_operands(query) + and_operands(self.query.filters)
+            return QueryNodeWrapper('AND', *subqueries)
         return query
 
     def filter(self, *args, **kwargs):
@@ -507,7 +630,11 @@ class QuerySet(object):
         if from_backend:
             new_query = self.query.clone(action='exists')
             return self.manager.execute(new_query)
-        return len(self) > 0
+        if self._populated:
+            return len(self._data) > 0
+        for value in self.iterator():
+            return True
+        return False
 
     def locally(self):
         """
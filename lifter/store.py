@@ -1,20 +1,56 @@
 import hashlib
+import itertools
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 from . import managers
 from . import adapters
 from . import exceptions
 from . import models
 from . import query
-from . import utils
+
+
+# Maximum number of intermediate values kept in a path memo
+PATH_MEMO_SIZE = 1024
+
+# Memo entry for values that were not resolved yet: no object is this sentinel
+_NOT_MEMOIZED = (object(), None)
 
 
 def path_to_value(data, path, **kwargs):
+    """
+    Return the value at the given path in data.
+
+    :param soft_fail: return ``Path.DoesNotExist`` instead of raising on missing fields
+    :param memo: an optional dict, used to remember values resolved on intermediate
+        objects (such as related objects shared by many rows). It must not outlive
+        the current query.
+    """
     soft_fail = kwargs.pop('soft_fail', False)
-    getters = [utils.attrgetter(part) for part in path.path]
+    memo = kwargs.pop('memo', None)
+    parts = path.path
+    getters = path.get_getters()
 
     try:
-        for getter in getters:
-            data = getter(data)
+        if memo is None or len(getters) < 2:
+            for getter in getters:
+                data = getter(data)
+            return data
+
+        data = getters[0](data)
+        for index in range(1, len(parts)):
+            key = (id(data), parts[index])
+            obj, value = memo.get(key, _NOT_MEMOIZED)
+            if obj is not data:
+                value = getters[index](data)
+                if len(memo) >= PATH_MEMO_SIZE:
+                    memo.clear()
+                # we keep a reference to data so its id cannot be reused
+                memo[key] = (data, value)
+            data = value
     except exceptions.MissingField:
         if soft_fail:
             return query.Path.DoesNotExist
@@ -22,17 +58,40 @@ def path_to_value(data, path, **kwargs):
     return data
 
 
+def digest(data):
+    """
+    Return a short, non-cryptographic hexadecimal digest of the given bytes,
+    suitable for cache keys
+    """
+    if xxhash is not None:
+        return xxhash.xxh3_64_hexdigest(data)
+    if hasattr(hashlib, 'blake2b'):
+        return hashlib.blake2b(data, digest_size=8).hexdigest()
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
 def cast_to_values(query, results):
     soft_fail = query.hints.get('permissive', False)
     from .backends.python import IterableStore
+    from .backends import compiler
+
+    paths = query.hints['paths']
+    iterator = iter(results)
+    for first in iterator:
+        break
+    else:
+        return IterableStore([]).query(models.Model).all()
+
+    # Getters are compiled once, using the first row to guess how values are accessed
     if query.hints['mode'] == 'mapping':
-        getter = lambda val: {str(path): path_to_value(val, path, soft_fail=soft_fail) for path in query.hints['paths']}
+        names = [str(path) for path in paths]
+        key = compiler.compile_key(paths, sample=first, soft_fail=soft_fail)
+        getter = lambda val: dict(zip(names, key(val)))
+    elif query.hints.get('flat', False):
+        getter = compiler.compile_getter(paths[0], sample=first, soft_fail=soft_fail)
     else:
-        if query.hints.get('flat', False):
-            getter = lambda val: path_to_value(val, query.hints['paths'][0], soft_fail=soft_fail)
-        else:
-            getter = lambda val: tuple(path_to_value(val, path, soft_fail=soft_fail) for path in query.hints['paths'])
-    values = map(getter, results)
+        getter = compiler.compile_key(paths, sample=first, soft_fail=soft_fail)
+    values = map(getter, itertools.chain([first], iterator))
 
     return IterableStore(values).query(models.Model).all()
 
@@ -123,5 +182,5 @@ class Store(object):
             return results
 
     def hash_query(self, query):
-        h = hash(query)
-        return hashlib.sha512(str(h).encode('utf-8')).hexdigest()[:20]
+        h = str(hash(query)).encode('utf-8')
+        return digest(h)
@@ -1,27 +1,60 @@
 import re
+import sys
 import operator
 import collections
 
 from . import exceptions
 
 
+_SNAKE_RE1 = re.compile(r'(.)([A-Z][a-z]+)')
+_SNAKE_RE2 = re.compile(r'([a-z0-9])([A-Z])')
+
+
+def memoize(maxsize=4096):
+    """
+    A minimal, python 2 compatible replacement for functools.lru_cache,
+    for functions taking a single hashable argument. When the cache is full,
+    it is simply cleared.
+    """
+    def decorator(func):
+        cache = {}
+
+        def wrapper(arg):
+            try:
+                return cache[arg]
+            except KeyError:
+                pass
+            if len(cache) >= maxsize:
+                cache.clear()
+            result = cache[arg] = func(arg)
+            return result
+
+        wrapper.cache = cache
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
 class IterableAttr(object):
 
     def __init__(self, iterable, key):
         self._getter = attrgetter(key)
         self._key = key
         self._items = iterable
-        self._resolved_items = []
+        self._resolved_items = None
 
-    def get_resolved_items(self):
-        from . import query
+    def _iter_resolved_items(self):
+        getter = self._getter
+        for item in self._items:
+            try:
+                yield getter(item)
+            except exceptions.MissingField:
+                pass
 
-        if not self._resolved_items:
-            for item in self._items:
-                try:
-                    self._resolved_items.append(self._getter(item))
-                except exceptions.MissingField:
-                    pass
+    def get_resolved_items(self):
+        if self._resolved_items is None:
+            self._resolved_items = tuple(self._iter_resolved_items())
 
         return self._resolved_items
 
@@ -34,67 +67,146 @@ class IterableAttr(object):
     def _resolve_test(self, test):
         resolved_items = self.get_resolved_items()
         if not resolved_items:
-            return test(resolved_items)
+            return test([])
 
         if isinstance(resolved_items[0], IterableAttr):
             # nested iterables
-            return any([item._resolve_test(test) for item in resolved_items])
+            return any(item._resolve_test(test) for item in resolved_items)
 
-        return any([test(item) for item in resolved_items])
+        return any(test(item) for item in resolved_items)
 
 def attrgetter(*items):
 
     if len(items) == 1:
         attr = items[0]
         def g(obj):
-            return resolve_attr(obj, attr)
+            resolver = _RESOLVER_CACHE.get((type(obj), attr))
+            if resolver is None:
+                return resolve_attr(obj, attr)
+            return resolver(obj, attr)
     else:
         def g(obj):
             return tuple(resolve_attr(obj, attr) for attr in items)
     return g
 
-def resolve_attr(obj, name):
-    """A custom attrgetter that operates both on dictionaries and objects"""
-    # TODO: setup some hinting, so we can go directly to the correct
-    # Maybe it's a dict ? Let's try dict lookup, it's the fastest
+
+def resolve_item(obj, name):
     try:
         return obj[name]
-    except TypeError:
-        pass
     except KeyError:
         raise exceptions.MissingField('Dict {0} has no attribute or key "{1}"'.format(obj, name))
 
-    # Okay, it's not a dict, what if we try to access the value as for a regular object attribute?
+def resolve_fallback(obj, name):
+    # Last possible choice, it's an iterable
+    if isinstance(obj, collections.Iterable):
+        return IterableAttr(obj, name)
+
+    raise exceptions.MissingField('Object {0} has no attribute or key "{1}"'.format(obj, name))
+
+def resolve_instance_attribute(obj, name):
     try:
         # Slight hack for better speed, since accessing dict is fast
         return obj.__dict__[name]
-    except (KeyError, AttributeError):
+    except KeyError:
         pass
 
+    return resolve_attribute(obj, name)
+
+def resolve_attribute(obj, name):
     try:
-        # Lookup using regular attribute
         return getattr(obj, name)
     except AttributeError:
         pass
 
-    # Last possible choice, it's an iterable
-    if isinstance(obj, collections.Iterable):
-        return IterableAttr(obj, name)
+    return resolve_fallback(obj, name)
 
-    raise exceptions.MissingField('Object {0} has no attribute or key "{1}"'.format(obj, name))
+def resolve_iterable(obj, name):
+    return IterableAttr(obj, name)
+
+def find_resolver(obj, name):
+    """
+    Probe the given object once to find the fastest way to access the
+    given name on objects of the same type
+    """
+    # Maybe it's a dict ? Let's try dict lookup, it's the fastest
+    try:
+        obj[name]
+    except TypeError:
+        pass
+    except KeyError:
+        return resolve_item
+    else:
+        return resolve_item
+
+    # Okay, it's not a dict, what if we try to access the value as for a regular object attribute?
+    if hasattr(obj, '__dict__'):
+        return resolve_instance_attribute
+
+    if not hasattr(obj, name) and isinstance(obj, collections.Iterable):
+        return resolve_iterable
+
+    return resolve_attribute
+
+# (type, name) -> resolver, populated by resolve_attr
+_RESOLVER_CACHE = {}
+_RESOLVER_CACHE_SIZE = 4096
+
+def resolve_attr(obj, name):
+    """A custom attrgetter that operates both on dictionaries and objects"""
+    key = (type(obj), name)
+    resolver = _RESOLVER_CACHE.get(key)
+    if resolver is None:
+        resolver = find_resolver(obj, name)
+        if len(_RESOLVER_CACHE) >= _RESOLVER_CACHE_SIZE:
+            _RESOLVER_CACHE.clear()
+        _RESOLVER_CACHE[key] = resolver
+    return resolver(obj, name)
+
+
+if sys.version_info >= (3, 7):
+    # dicts are guaranteed to preserve insertion order
+    _ordered_fromkeys = dict.fromkeys
+else:
+    _ordered_fromkeys = collections.OrderedDict.fromkeys
 
 
 def unique_everseen(seq):
-    """Solution found here : http://stackoverflow.com/questions/480214/how-do-you-remove-duplicates-from-a-list-in-python-whilst-preserving-order"""
-    seen = set()
-    seen_add = seen.add
-    return [x for x in seq if not (x in seen or seen_add(x))]
+    """Remove duplicates from seq, preserving order"""
+    if not isinstance(seq, (list, tuple)):
+        # we may need to iterate twice
+        seq = list(seq)
+    try:
+        return list(_ordered_fromkeys(seq))
+    except TypeError:
+        # unhashable values
+        return list(iunique_everseen(seq))
 
 
+def iunique_everseen(seq):
+    """
+    Lazy version of :py:func:`unique_everseen`. Unhashable values (such as dicts)
+    are supported, but are compared to each other one by one.
+    """
+    seen = set()
+    seen_add = seen.add
+    seen_unhashable = []
+    for x in seq:
+        try:
+            if x in seen:
+                continue
+            seen_add(x)
+        except TypeError:
+            if x in seen_unhashable:
+                continue
+            seen_unhashable.append(x)
+        yield x
+
+
+@memoize(maxsize=4096)
 def to_snake_case(s):
-    s1 = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', s)
-    return re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()
+    return _SNAKE_RE2.sub(r'\1_\2', _SNAKE_RE1.sub(r'\1_\2', s)).lower()
 
+@memoize(maxsize=4096)
 def to_camel_case(s):
     new_s = ''.join(x.capitalize() or '_' for x in s.split('_'))
     lower_first_letter = lambda s: s[:1].lower() + s[1:] if s else ''
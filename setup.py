@@ -21,6 +21,15 @@ requirements = [
     'persisting_theory',
 ]
 
+extras_requirements = {
+    # Vectorized aggregates
+    'numpy': ['numpy'],
+    # JIT compiled reduction kernels
+    'numba': ['numpy', 'numba'],
+    # Faster cache keys
+    'xxhash': ['xxhash'],
+}
+
 test_requirements = [
     'pytest',
     'django',
@@ -43,6 +52,7 @@ setup(
                  'lifter'},
     include_package_data=True,
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="BSD",
     zip_safe=False,
     keywords='lifter',
@@ -41,3 +41,30 @@ class TestETreeAdapter(unittest.TestCase):
                 v = getattr(static_file, name)
 
                 self.assertEqual(v, e.text)
+
+
+class TestAdapter(unittest.TestCase):
+
+    def test_adapter_calls_field_cleaners(self):
+        class CleaningAdapter(adapters.DictAdapter):
+            def clean_name(self, data, value, model, field):
+                return value.upper()
+
+        adapter = CleaningAdapter()
+        self.assertEqual(list(adapter.get_cleaners().keys()), ['name'])
+
+        instance = adapter.parse({'name': 'test', 'id': 1}, StaticFile)
+        self.assertEqual(instance.name, 'TEST')
+        self.assertEqual(instance.id, 1)
+
+    def test_adapter_uses_field_conversion(self):
+        class Release(models.Model):
+            year = models.IntegerField()
+
+        adapter = adapters.DictAdapter()
+        first = adapter.parse({'year': '1969', 'title': 'Abbey Road'}, Release)
+        second = adapter.parse({'year': '1973'}, Release)
+        self.assertEqual(first.year, 1969)
+        self.assertEqual(first.title, 'Abbey Road')
+        self.assertEqual(second.year, 1973)
+        self.assertEqual(list(adapter.get_field_cleaners(Release).keys()), ['year'])
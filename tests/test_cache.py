@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
-import datetime
 import unittest
 import mock
 import json
@@ -54,6 +53,15 @@ class TestCache(unittest.TestCase):
         self.assertEqual(
             store.get_cache_key(query, TModel), expected)
 
+    def test_hash_query_is_a_short_stable_digest(self):
+        store = self.manager.store
+        h1 = store.hash_query(self.manager.filter(TModel.order > 1).query)
+        h2 = store.hash_query(self.manager.filter(TModel.order > 1).query)
+        h3 = store.hash_query(self.manager.filter(TModel.order > 2).query)
+        self.assertEqual(h1, h2)
+        self.assertNotEqual(h1, h3)
+        self.assertEqual(len(h1), 16)
+
     def test_store_tries_to_return_from_cache_before_executing_query(self):
         with mock.patch('lifter.store.Store.get_from_cache', side_effect=exceptions.NotInCache()) as m:
             qs = self.manager.all()
@@ -90,17 +98,28 @@ class TestDummyCache(unittest.TestCase):
         r = self.cache.get_or_set('key', 'value')
         self.assertEqual(r, 'value')
 
-    def test_can_pass_callable_to_set(self):
+    def test_can_pass_factory_to_set(self):
         f = lambda: 'yolo'
 
-        r = self.cache.get_or_set('key', f)
+        r = self.cache.get_or_set('key', factory=f)
         self.assertEqual(r, 'yolo')
+        self.assertEqual(self.cache.get('key'), 'yolo')
+
+    def test_callable_values_are_stored_as_is(self):
+        f = lambda: 'yolo'
+
+        self.cache.set('key', f)
+        self.assertIs(self.cache.get('key'), f)
+
+    def test_set_requires_value_or_factory(self):
+        with self.assertRaises(ValueError):
+            self.cache.set('key')
 
     def test_can_provide_timeout(self):
-        now = datetime.datetime.now()
+        now = self.cache.get_now()
         self.cache.set('key', 'value', 3600)
-        with mock.patch('lifter.caches.Cache.get_now', return_value=now + datetime.timedelta(seconds=3599)):
+        with mock.patch('lifter.caches.Cache.get_now', return_value=now + 3599):
             self.assertEqual(self.cache.get('key'), 'value')
 
-        with mock.patch('lifter.caches.Cache.get_now', return_value=now + datetime.timedelta(seconds=3601)):
+        with mock.patch('lifter.caches.Cache.get_now', return_value=now + 3601):
             self.assertEqual(self.cache.get('key'), None)
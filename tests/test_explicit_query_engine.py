@@ -8,6 +8,7 @@ test_lifter
 Tests for `lifter` module.
 """
 
+import json
 import random
 import sys
 import unittest
@@ -43,9 +44,11 @@ class TestBase(unittest.TestCase):
 
     DICTS = [o.__dict__ for o in OBJECTS]
 
-    def setUp(self):
-        self.manager = IterableStore(self.OBJECTS).query(TModel)
-        self.dict_manager = IterableStore(self.DICTS).query(TModel)
+    @classmethod
+    def setUpClass(cls):
+        # managers are immutable, they can be shared by all tests
+        cls.manager = IterableStore(cls.OBJECTS).query(TModel)
+        cls.dict_manager = IterableStore(cls.DICTS).query(TModel)
 
 
 class TModel(lifter.models.Model):
@@ -255,6 +258,7 @@ class TestQueries(TestBase):
         self.assertEqual(self.manager.all().values_list(TModel.a, flat=True), [1, 1, 2, 2])
         self.assertEqual(self.manager.all().values_list(TModel.a, flat=True).distinct(), [1, 2])
         self.assertEqual(self.manager.all().values_list(TModel.parent, flat=True).distinct(), self.PARENTS)
+        self.assertEqual(self.manager.all().values(TModel.a).distinct(), [{'a': 1}, {'a': 2}])
 
     def test_run_filter_on_nested_iterables(self):
         data = [
@@ -524,6 +528,68 @@ class TestAggregation(TestBase):
     def test_flat(self):
         self.assertEqual(self.manager.aggregate((TModel.a, mean), flat=True), [1.5])
 
+    def test_aggregates_on_large_datasets(self):
+        objects = [TObject(name=str(i), a=i, b=i / 2.) for i in range(1000)]
+        manager = IterableStore(objects).query(TModel)
+        aggregates = (
+            lifter.aggregates.Sum('a'),
+            lifter.aggregates.Min('a'),
+            lifter.aggregates.Max('b'),
+            lifter.aggregates.Avg('a'),
+            lifter.aggregates.Min('name'),
+        )
+        expected = {
+            'a__sum': 499500,
+            'a__min': 0,
+            'b__max': 499.5,
+            'a__avg': 499.5,
+            'name__min': '0',
+        }
+        self.assertEqual(manager.aggregate(*aggregates), expected)
+
+    def test_aggregates_on_large_integers_do_not_overflow(self):
+        objects = [TObject(name=str(i), a=2 ** 62, b=-2 ** 62 - i) for i in range(64)]
+        manager = IterableStore(objects).query(TModel)
+        aggregates = (
+            lifter.aggregates.Sum('a'),
+            lifter.aggregates.Avg('a'),
+            lifter.aggregates.Sum('b'),
+            lifter.aggregates.Min('b'),
+        )
+        expected = {
+            'a__sum': 64 * 2 ** 62,
+            'a__avg': float(2 ** 62),
+            'b__sum': -64 * 2 ** 62 - 2016,
+            'b__min': -2 ** 62 - 63,
+        }
+        self.assertEqual(manager.aggregate(*aggregates), expected)
+        self.assertEqual(lifter.aggregates.Sum('a').aggregate([o.a for o in objects]), 64 * 2 ** 62)
+
+        values = [2 ** 60 + 1] + [0.5] * 70
+        self.assertEqual(lifter.aggregates.Max('a').aggregate(values), 2 ** 60 + 1)
+        self.assertEqual(lifter.aggregates.Sum('a').aggregate(values), sum(values))
+
+    def test_aggregates_on_many_values_return_python_scalars(self):
+        objects = [TObject(name=str(i), a=i, order=i / 2.) for i in range(100)]
+        manager = IterableStore(objects).query(TModel)
+        # numpy reductions, as used without numba
+        with mock.patch('lifter._numba_kernels.get_kernel', return_value=None):
+            results = manager.aggregate(
+                lifter.aggregates.Sum('a'), lifter.aggregates.Max('order'), (TModel.a, max))
+        self.assertEqual(results, {'a__sum': 4950, 'order__max': 49.5, 'a__max': 99})
+        self.assertEqual([type(results[key]) for key in ('a__sum', 'order__max', 'a__max')], [int, float, int])
+        json.dumps(results)
+
+    def test_numba_kernels_are_only_used_on_large_arrays(self):
+        values = list(range(100))
+        with mock.patch('lifter._numba_kernels.get_kernel', return_value=None) as get_kernel:
+            self.assertEqual(lifter.aggregates.Sum('a').aggregate(values), 4950)
+            self.assertEqual(get_kernel.call_count, 0)
+
+            values = list(range(lifter.aggregates.KERNEL_THRESHOLD))
+            self.assertEqual(lifter.aggregates.Max('a').aggregate(values), values[-1])
+            get_kernel.assert_called_once_with('max')
+
 if __name__ == '__main__':
     import sys
     sys.exit(unittest.main())
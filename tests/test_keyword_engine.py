@@ -42,11 +42,13 @@ class TestBase(unittest.TestCase):
 
     DICTS = [o.__dict__ for o in OBJECTS]
 
-    def setUp(self):
+    @classmethod
+    def setUpClass(cls):
+        # managers are immutable, they can be shared by all tests
         class TModel(lifter.models.Model):
             pass
-        self.manager = IterableStore(self.OBJECTS).query(TModel)
-        self.dict_manager = IterableStore(self.DICTS).query(TModel)
+        cls.manager = IterableStore(cls.OBJECTS).query(TModel)
+        cls.dict_manager = IterableStore(cls.DICTS).query(TModel)
 
 class TestQueries(TestBase):
 
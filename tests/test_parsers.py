@@ -1,6 +1,9 @@
+# -*- coding: utf-8 -*-
 import unittest
 import xml.etree.ElementTree as ET
 
+import requests
+
 from lifter import parsers
 
 
@@ -64,3 +67,17 @@ class TestParsers(unittest.TestCase):
         for i, title in enumerate(['Hello', 'World']):
             r = result[i]
             self.assertEqual(r[0].text, title)
+
+    def test_json_parser_accepts_bytes(self):
+        parser = parsers.JSONParser()
+        self.assertEqual(parser.parse(b'{"title": "Hello"}'), {'title': 'Hello'})
+        self.assertEqual(parser.parse('{"title": "Hello"}'), {'title': 'Hello'})
+
+    def test_json_responses_are_decoded_from_bytes(self):
+        parser = parsers.JSONParser()
+        response = requests.Response()
+        response._content = u'[{"title": "Café"}]'.encode('utf-8')
+        response.headers['Content-Type'] = 'text/plain'
+        # what requests infers for text types without a charset
+        response.encoding = 'ISO-8859-1'
+        self.assertEqual(parser.parse_response(response), [{'title': u'Café'}])
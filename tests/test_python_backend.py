@@ -1,4 +1,5 @@
 
+import heapq
 import random
 import sys
 import unittest
@@ -8,7 +9,10 @@ import lifter.models
 import lifter.aggregates
 import lifter.exceptions
 import lifter.lookups
-from lifter.backends.python import IterableStore
+import lifter.backends.compiler
+import lifter.query
+import lifter._numba_kernels
+from lifter.backends.python import IterableStore, ColumnarStore, QueryImpl
 
 
 class TObject(object):
@@ -34,9 +38,11 @@ class TestBase(unittest.TestCase):
 
     DICTS = [o.__dict__ for o in OBJECTS]
 
-    def setUp(self):
-        self.manager = IterableStore(self.OBJECTS).query(TModel)
-        self.dict_manager = IterableStore(self.DICTS).query(TModel)
+    @classmethod
+    def setUpClass(cls):
+        # managers are immutable, they can be shared by all tests
+        cls.manager = IterableStore(cls.OBJECTS).query(TModel)
+        cls.dict_manager = IterableStore(cls.DICTS).query(TModel)
 
 
 class TModel(lifter.models.Model):
@@ -54,3 +60,427 @@ class TestQueries(TestBase):
         manager = IterableStore(self.OBJECTS).query(TModel)
         qs = manager.filter(nope='something').hints(permissive=True)
         list(qs)
+
+    def test_cheap_lookups_are_evaluated_first(self):
+        calls = []
+
+        def expensive(value):
+            calls.append(value)
+            return True
+
+        qs = self.manager.filter(TModel.order.test(expensive), TModel.order.test(lifter.lookups.value_in([1, 4])))
+        self.assertEqual(list(qs), self.OBJECTS[2:])
+        self.assertEqual(calls, [1, 4])
+
+        # other paths may be guarded by the expensive lookup
+        del calls[:]
+        qs = self.manager.filter(TModel.order.test(expensive), TModel.a == 2)
+        self.assertEqual(list(qs), self.OBJECTS[2:])
+        self.assertEqual(len(calls), len(self.OBJECTS))
+
+    def test_guard_lookups_are_evaluated_before_the_lookups_they_protect(self):
+        values = [{'v': None}, {'v': 5}]
+        manager = IterableStore(values).query(TModel)
+        queries = [
+            (TModel.v != None, TModel.v > 3),
+            (TModel.v.test(lambda v: v is not None), TModel.v > 3),
+        ]
+        for q in queries:
+            self.assertEqual(manager.filter(*q), [values[1]])
+            self.assertEqual(manager.filter(q[0] & q[1]), [values[1]])
+            self.assertEqual(manager.filter(~(~q[0] | ~q[1])), [values[1]])
+            node = q[0] & q[1]
+            self.assertEqual([QueryImpl(node, hints={})(v) for v in values], [False, True])
+
+    def test_guards_on_other_paths_are_evaluated_first(self):
+        values = [{'parent': None}, {'parent': {'name': 'x'}}]
+        manager = IterableStore(values).query(TModel)
+        queries = [
+            (TModel.parent != None, TModel.parent.name == 'x'),
+            (TModel.parent.test(lambda p: p is not None), TModel.parent.name == 'x'),
+        ]
+        for q in queries:
+            self.assertEqual(manager.filter(*q), [values[1]])
+            self.assertEqual(manager.exclude(~q[0] | ~q[1]), [values[1]])
+            node = q[0] & q[1]
+            self.assertEqual([QueryImpl(node, hints={})(v) for v in values], [False, True])
+
+        # lookups that cannot raise are only moved ahead of others on the same path
+        node = (TModel.a > 1) & (TModel.a == 2) & (TModel.b == 1)
+        self.assertEqual(
+            node.ordered_subqueries(),
+            [node.subqueries[1], node.subqueries[0], node.subqueries[2]])
+        node = (TModel.a > 1) & (TModel.b == 1)
+        self.assertEqual(node.ordered_subqueries(), list(node.subqueries))
+
+    def test_filters_are_compiled_using_sample_row(self):
+        c = lifter.backends.compiler.Compiler(self.DICTS[0], hints={})
+        q = (TModel.a == 1) & (TModel.parent.name == 'parent_1')
+        self.assertEqual(q.to_source(c), "((o['a'] == _c0) and (o['parent'].name == _c1))")
+
+        c = lifter.backends.compiler.Compiler(self.OBJECTS[0], hints={})
+        self.assertEqual(q.to_source(c), "((o.a == _c0) and (o.parent.name == _c1))")
+
+    def test_compiled_filters_are_reused_by_identical_queries(self):
+        lifter.backends.python._compiled_filters.clear()
+        with mock.patch('lifter.backends.compiler.compile_filters_factory', wraps=lifter.backends.compiler.compile_filters_factory) as compile_filters:
+            for i in range(3):
+                self.assertEqual(self.dict_manager.filter((TModel.a == 1) & (TModel.parent.name == 'parent_1')), self.DICTS[:2])
+            self.assertEqual(compile_filters.call_count, 1)
+
+            # other values
+            self.assertEqual(self.dict_manager.filter((TModel.a == 2) & (TModel.parent.name == 'parent_2')), self.DICTS[2:])
+            self.assertEqual(compile_filters.call_count, 2)
+
+            # unhashable values are not cached
+            for i in range(2):
+                self.assertEqual(self.dict_manager.filter(TModel.order.test(lifter.lookups.value_in([1, 4]))), [self.DICTS[2], self.DICTS[3]])
+            self.assertEqual(compile_filters.call_count, 4)
+
+    def test_cached_filters_do_not_share_memos(self):
+        lifter.backends.python._compiled_filters.clear()
+        # the first row has no parent, so other rows are resolved with memos
+        parent = {'name': 'x'}
+        values = [{'a': 1}] + [{'a': 1, 'parent': parent} for i in range(2)]
+        manager = IterableStore(values).query(TModel).hints(permissive=True)
+        q = TModel.parent.name == 'x'
+
+        suspended = manager.filter(q).iterator()
+        self.assertEqual(next(suspended), values[1])
+        parent['name'] = 'renamed'
+        self.assertEqual(manager.filter(q), [])
+        self.assertEqual(len(lifter.backends.python._compiled_filters), 1)
+
+    def test_paths_are_compiled_to_getters(self):
+        getter = lifter.backends.compiler.compile_getter(TModel.parent.name, sample=self.DICTS[0])
+        self.assertEqual([getter(row) for row in self.DICTS], ['parent_1', 'parent_1', 'parent_2', 'parent_2'])
+        # other structures use the generic getter
+        self.assertEqual(getter(self.OBJECTS[2]), 'parent_2')
+        with self.assertRaises(lifter.exceptions.MissingField):
+            getter({'name': 'test_5'})
+
+        getter = lifter.backends.compiler.compile_getter(TModel.nope, sample=self.OBJECTS[0], soft_fail=True)
+        self.assertEqual(getter(self.OBJECTS[0]), lifter.query.Path.DoesNotExist)
+
+    def test_test_lookups_are_compiled_inline(self):
+        c = lifter.backends.compiler.Compiler(self.DICTS[0], hints={})
+        q = TModel.label.test(lifter.lookups.startswith('a'))
+        self.assertEqual(q.to_source(c), "(o['label'].startswith(_c0))")
+
+        c = lifter.backends.compiler.Compiler(self.DICTS[0], hints={})
+        q = TModel.order.test(lifter.lookups.value_in([1, 3]))
+        self.assertEqual(q.to_source(c), "(o['order'] in _c0)")
+        self.assertEqual(c.constants, [frozenset([1, 3])])
+        self.assertEqual(q.rank, 0)
+
+        func = lambda v, *args, **kwargs: v in args
+        c = lifter.backends.compiler.Compiler(self.DICTS[0], hints={})
+        q = TModel.order.test(func, 1, 3)
+        self.assertEqual(q.to_source(c), "(_c0(o['order'], *_c1, **_c2))")
+        self.assertEqual(self.dict_manager.filter(q), [self.DICTS[1], self.DICTS[2]])
+
+        # unhashable values fall back on the generic implementation
+        values = [{'order': 1}, {'order': [3]}, {'order': 3}]
+        manager = IterableStore(values).query(TModel)
+        self.assertEqual(manager.filter(TModel.order.test(lifter.lookups.value_in([1, 3]))), [values[0], values[2]])
+
+        # other references are not hashed, their hash may not match equality
+        class Loose(object):
+            def __init__(self, value):
+                self.value = value
+
+            def __eq__(self, other):
+                return getattr(other, 'value', other) == self.value
+
+            def __hash__(self):
+                return id(self)
+
+        c = lifter.backends.compiler.Compiler(self.DICTS[0], hints={})
+        reference = [Loose(1), Loose(3)]
+        q = TModel.order.test(lifter.lookups.value_in(reference))
+        self.assertEqual(q.to_source(c), "(o['order'] in _c0)")
+        self.assertEqual(c.constants, [reference])
+        values = [{'order': Loose(1)}, {'order': Loose(2)}, {'order': 3}]
+        self.assertEqual(IterableStore(values).query(TModel).filter(q), [values[0], values[2]])
+
+    def test_equality_on_nested_iterables_is_compiled_to_loops(self):
+        values = [
+            {'name': 'Kurt', 'tags': [{'name': 'nice', 'subtags': [{'name': 'a'}, {'name': 'b'}]}]},
+            {'name': 'Bill', 'tags': [{'name': 'friendly', 'subtags': []}, {'name': 'nice', 'subtags': [{'name': 'c'}]}]},
+            {'name': 'Jane', 'tags': []},
+            {'name': 'Lola', 'tags': [{'subtags': [{'name': 'c'}]}]},
+        ]
+        c = lifter.backends.compiler.Compiler(values[0], hints={})
+        q = TModel.tags.subtags.name == 'c'
+        self.assertEqual(q.to_source(c), "(any(_i1['name'] == _c0 for _i0 in o['tags'] for _i1 in _i0['subtags']))")
+
+        manager = IterableStore(values).query(TModel)
+        self.assertEqual(manager.filter(q), values[1::2])
+        self.assertEqual(manager.exclude(q), values[::2])
+        self.assertEqual(manager.filter(TModel.tags.name == 'nice'), values[:2])
+
+    def test_values_use_compiled_getters(self):
+        values = self.DICTS + self.OBJECTS
+        manager = IterableStore(values).query(TModel)
+        expected = [(o.order, o.parent.name) for o in self.OBJECTS] * 2
+        self.assertEqual(manager.values_list(TModel.order, TModel.parent.name), expected)
+        self.assertEqual(manager.values_list(TModel.order, flat=True), [o for o, _ in expected])
+        self.assertEqual(
+            manager.values(TModel.order, TModel.parent.name),
+            [{'order': o, 'parent.name': p} for o, p in expected])
+        self.assertEqual(list(manager.filter(TModel.order > 10).values_list(TModel.order)), [])
+
+    def test_compiled_filters_fall_back_on_rows_with_another_structure(self):
+        values = [
+            {'a': 1, 'tags': [{'name': 'nice'}]},
+            self.OBJECTS[0],
+            {'a': 2, 'tags': []},
+            {'a': 1, 'tags': {'name': 'nice'}},
+        ]
+        manager = IterableStore(values).query(TModel)
+        self.assertEqual(manager.filter(TModel.a == 1), [values[0], self.OBJECTS[0], values[3]])
+        self.assertEqual(manager.filter(TModel.tags.name == 'nice').hints(permissive=True), [values[0], values[3]])
+
+        with self.assertRaises(lifter.exceptions.MissingField):
+            list(manager.filter(TModel.a == 1, TModel.name == 'test_1'))
+
+    def test_values_of_shared_related_objects_are_resolved_once_per_query(self):
+        calls = []
+
+        class Parent(object):
+            def __init__(self, name):
+                self._name = name
+
+            @property
+            def name(self):
+                calls.append(self._name)
+                return self._name
+
+        parents = [Parent('parent_1'), Parent('parent_2')]
+        values = [TObject(name='test_{0}'.format(i), parent=parents[i % 2]) for i in range(10)]
+        manager = IterableStore(values).query(TModel)
+
+        self.assertEqual(manager.filter(TModel.parent.name == 'parent_1'), values[::2])
+        self.assertEqual(sorted(calls), ['parent_1', 'parent_2'])
+
+        # the memo does not outlive the query
+        del calls[:]
+        self.assertEqual(manager.order_by(TModel.parent.name), values[::2] + values[1::2])
+        self.assertEqual(sorted(calls), ['parent_1', 'parent_2'])
+
+    def test_none_related_objects_are_resolved_with_memos(self):
+        values = [{'parent': None}, {'parent': {'name': 'x'}}]
+        manager = IterableStore(values).query(TModel).hints(permissive=True)
+
+        self.assertEqual(manager.filter(TModel.parent.name == 'x'), values[1:])
+        self.assertEqual(manager.exclude(TModel.parent.name == 'x'), values[:1])
+        self.assertEqual(
+            list(manager.values_list(TModel.parent.name, flat=True)),
+            [lifter.query.Path.DoesNotExist, 'x'])
+
+    def test_orderings_in_the_same_direction_are_sorted_at_once(self):
+        values = [{'a': i % 3, 'b': i % 4, 'c': i} for i in range(24)]
+        manager = IterableStore(values).query(TModel)
+        orderings = [
+            ('a', 'b', '-c'),
+            ('-a', '-b', 'c'),
+            ('a', '-b', '-c'),
+        ]
+        for ordering in orderings:
+            expected = list(values)
+            for o in reversed(ordering):
+                expected.sort(key=lambda v: v[o.lstrip('-')], reverse=o.startswith('-'))
+            with mock.patch('lifter.backends.compiler.compile_key', wraps=lifter.backends.compiler.compile_key) as compile_key:
+                self.assertEqual(manager.order_by(*ordering), expected)
+            self.assertEqual(compile_key.call_count, 1)
+
+        self.assertEqual(len(manager.order_by('?')), 24)
+
+    def test_sliced_orderings_only_select_needed_values(self):
+        values = [{'a': i % 5, 'b': i} for i in range(40)]
+        manager = IterableStore(values).query(TModel)
+        with mock.patch('heapq.nsmallest', wraps=heapq.nsmallest) as nsmallest:
+            self.assertEqual(manager.order_by(TModel.a)[2:5], sorted(values, key=lambda v: v['a'])[2:5])
+        self.assertEqual(nsmallest.call_count, 1)
+        with mock.patch('heapq.nlargest', wraps=heapq.nlargest) as nlargest:
+            self.assertEqual(manager.order_by('-a', '-b')[:3], sorted(values, key=lambda v: (v['a'], v['b']), reverse=True)[:3])
+        self.assertEqual(nlargest.call_count, 1)
+
+        # large windows are sorted as usual
+        self.assertEqual(manager.order_by('a')[:30], sorted(values, key=lambda v: v['a'])[:30])
+        self.assertEqual(manager.order_by('a', '-b')[:3], sorted(sorted(values, key=lambda v: -v['b']), key=lambda v: v['a'])[:3])
+
+    def test_first_and_exists_stop_at_the_first_result(self):
+        calls = []
+
+        def test(value):
+            calls.append(value)
+            return value > 1
+
+        qs = self.manager.filter(TModel.order.test(test))
+        self.assertEqual(qs.first(), self.OBJECTS[0])
+        self.assertEqual(calls, [2])
+        self.assertTrue(qs.exists())
+        self.assertEqual(calls, [2, 2])
+        self.assertEqual(qs.last(), self.OBJECTS[3])
+        self.assertEqual(len(calls), 6)
+
+        # once the queryset is fetched, results are reused
+        list(qs)
+        del calls[:]
+        self.assertEqual(qs.first(), self.OBJECTS[0])
+        self.assertEqual(qs.last(), self.OBJECTS[3])
+        self.assertTrue(qs.exists())
+        self.assertEqual(calls, [])
+
+    def test_aggregates_on_the_same_path_are_computed_in_a_single_pass(self):
+        values = [{'a': i, 'b': -i} for i in range(100)]
+        manager = IterableStore(values).query(TModel)
+        aggregates = (
+            lifter.aggregates.Sum('a'),
+            lifter.aggregates.Avg('a'),
+            (TModel.a, max),
+            (TModel.b, min),
+        )
+        expected = {'a__sum': 4950, 'a__avg': 49.5, 'a__max': 99, 'b__min': -99}
+        with mock.patch('lifter.aggregates._asarray', wraps=lifter.aggregates._asarray) as asarray:
+            self.assertEqual(manager.aggregate(*aggregates), expected)
+        # values are converted once per path
+        converted = [c for c in asarray.call_args_list if isinstance(c[0][0], list)]
+        self.assertEqual(len(converted), 2)
+
+    def test_aggregate_subclasses_overriding_aggregate_are_not_bypassed(self):
+        class RoundedAvg(lifter.aggregates.Avg):
+            def aggregate(self, values):
+                return round(super(RoundedAvg, self).aggregate(values), 1)
+
+        values = [{'a': 1}, {'a': 2}, {'a': 2}]
+        manager = IterableStore(values).query(TModel)
+        self.assertEqual(manager.aggregate(RoundedAvg('a'), lifter.aggregates.Sum('a')), {'a__avg': 1.7, 'a__sum': 5})
+
+
+@unittest.skipIf(lifter.lookups.numpy is None, 'numpy is not installed')
+class TestColumnarStore(TestBase):
+
+    def setUp(self):
+        self.values = [
+            {'name': 'test_{0}'.format(i), 'a': i % 3, 'order': float(i), 'parent': TestBase.PARENTS[i % 2], 'mixed': i if i % 2 else None}
+            for i in range(20)
+        ]
+        self.manager = IterableStore(self.values).query(TModel)
+        self.columnar_manager = ColumnarStore(self.values).query(TModel)
+
+    def test_columns_are_built_for_scalar_values(self):
+        store = self.columnar_manager.store
+        self.assertEqual(sorted(store.columns.keys()), ['a', 'mixed', 'name', 'order'])
+        self.assertEqual(store.columns['mixed'].dtype, object)
+
+    def test_columnar_store_returns_same_results_as_iterable_store(self):
+        queries = [
+            TModel.a == 1,
+            TModel.order > 4,
+            (TModel.a == 1) | (TModel.order <= 3),
+            ~((TModel.a == 2) & (TModel.order >= 10)),
+            (TModel.a == 2) & (TModel.parent.name == 'parent_1'),
+            (TModel.parent.name == 'parent_1') | (TModel.order < 2),
+            TModel.mixed == None,
+            TModel.name.test(lifter.lookups.value_in(['test_1', 'test_2'])),
+            TModel.order.test(lifter.lookups.value_range((2, 5))),
+            TModel.name.exists(),
+            TModel.name.test(lifter.lookups.startswith('test_1')),
+            TModel.name.test(lifter.lookups.endswith('2')),
+            TModel.name.test(lifter.lookups.contains('_1')),
+            TModel.name.test(lifter.lookups.istartswith('TEST_1')),
+            TModel.name.test(lifter.lookups.iendswith('T_2')),
+            TModel.name.test(lifter.lookups.icontains('ST_1')) & (TModel.a > 0),
+        ]
+        for q in queries:
+            self.assertEqual(self.columnar_manager.filter(q), list(self.manager.filter(q)))
+            self.assertEqual(self.columnar_manager.exclude(q), list(self.manager.exclude(q)))
+
+    def test_string_lookups_are_vectorized(self):
+        store = self.columnar_manager.store
+        node = TModel.name.test(lifter.lookups.icontains('TEST_1'))
+        self.assertIsNotNone(store.get_mask(node, {}))
+        self.assertIn('name', store.lowered_columns)
+        # not a string column
+        node = TModel.order.test(lifter.lookups.startswith('1'))
+        self.assertIsNone(store.get_mask(node, {}))
+
+    def test_masks_are_packed_as_uint64_words(self):
+        import numpy
+        from lifter.backends.python import pack_mask, unpack_mask
+
+        for size in (1, 63, 64, 65, 200):
+            mask = numpy.array([i % 3 == 0 for i in range(size)])
+            packed = pack_mask(mask)
+            self.assertEqual(packed.dtype, numpy.uint64)
+            self.assertEqual(len(packed), (size + 63) // 64)
+            self.assertEqual(unpack_mask(packed, size).tolist(), mask.tolist())
+            self.assertEqual(unpack_mask(~packed, size).tolist(), (~mask).tolist())
+
+    @unittest.skipIf(lifter._numba_kernels.get_kernel('sum') is None, 'numba is not installed')
+    def test_numeric_filters_are_compiled_to_numba_kernels(self):
+        store = ColumnarStore(self.values)
+        store.kernel_threshold = 0
+        manager = store.query(TModel)
+
+        q = (TModel.a == 1) | ~((TModel.order >= 2) & (TModel.order < 5.5))
+        self.assertIsNotNone(store.get_kernel_mask(q))
+        self.assertEqual(manager.filter(q), list(self.manager.filter(q)))
+
+        # strings, nullable values and related lookups are not compiled
+        self.assertIsNone(store.get_kernel_mask(TModel.name == 'test_1'))
+        self.assertIsNone(store.get_kernel_mask(TModel.mixed == 1))
+        self.assertIsNone(store.get_kernel_mask((TModel.a == 1) & (TModel.parent.name == 'parent_1')))
+        self.assertEqual(manager.filter(TModel.mixed == 1), list(self.manager.filter(TModel.mixed == 1)))
+
+    def test_value_in_with_many_values(self):
+        many = lifter.lookups.value_in(list(range(0, 40, 3)))
+        names = lifter.lookups.value_in(['test_{0}'.format(i) for i in range(0, 40, 3)])
+        mixed = lifter.lookups.value_in(list(range(0, 40, 3)) + [None, 'test_1'])
+        queries = [
+            TModel.a.test(many),
+            TModel.order.test(many),
+            TModel.name.test(names),
+            TModel.name.test(many),
+            TModel.mixed.test(mixed),
+        ]
+        for q in queries:
+            self.assertEqual(self.columnar_manager.filter(q), list(self.manager.filter(q)))
+
+    def test_value_in_with_many_mixed_values_does_not_coerce_them(self):
+        strings = [{'n': '1'}, {'n': 'a'}, {'n': '3'}]
+        numbers = [{'n': 1}, {'n': 2}, {'n': 3}]
+        q = TModel.n.test(lifter.lookups.value_in([1, 'a', '3'] + list(range(10, 20))))
+        for rows in (strings, numbers):
+            self.assertEqual(
+                ColumnarStore(rows).query(TModel).filter(q),
+                list(IterableStore(rows).query(TModel).filter(q)))
+
+    def test_columnar_store_keeps_python_semantics_on_edge_values(self):
+        values = [
+            {'big': 2 ** 53 + 1, 'order': float(2 ** 53), 'nul': u'a\x00', 'count': None, 'kind': 'none'},
+            {'big': 1, 'order': 1.0, 'nul': u'a', 'count': 4, 'kind': 'number'},
+        ]
+        store = ColumnarStore(values)
+        self.assertEqual(store.columns['big'].dtype, object)
+        self.assertEqual(store.columns['nul'].dtype, object)
+
+        queries = [
+            TModel.big == float(2 ** 53),
+            TModel.order == 2 ** 53 + 1,
+            TModel.order.test(lifter.lookups.value_in([2 ** 53 + 1, 1])),
+            TModel.nul == u'a',
+            (TModel.count != None) & (TModel.count > 3),
+            (TModel.kind == 'number') & ((TModel.order > 2) | (TModel.count > 3)),
+            (TModel.count == None) | (TModel.count > 3),
+        ]
+        manager = IterableStore(values).query(TModel)
+        for q in queries:
+            self.assertEqual(store.query(TModel).filter(q), list(manager.filter(q)))
+
+    def test_heterogeneous_rows_are_not_stored_in_columns(self):
+        store = ColumnarStore([{'a': 1}, {'b': 2}])
+        self.assertEqual(store.columns, {})
+        self.assertEqual(store.query(TModel).filter(TModel.a == 1).hints(permissive=True), [{'a': 1}])
@@ -65,3 +65,13 @@ class TestQuery(unittest.TestCase):
         a2 = a1.clone()
 
         self.assertEqual(hash(a1), hash(a2))
+
+    def test_chained_filters_are_merged_in_a_single_and_node(self):
+        manager = IterableStore([]).query(TModel)
+        qs = manager.filter(TModel.a == 1).filter((TModel.b == 2) & (TModel.c == 3)).exclude(TModel.d == 4)
+        filters = qs.query.filters
+
+        self.assertEqual(filters.operator, 'AND')
+        self.assertEqual(len(filters.subqueries), 4)
+        self.assertTrue(filters.subqueries[0].inverted)
+        self.assertEqual([str(sq.path) for sq in filters.subqueries], ['d', 'b', 'c', 'a'])
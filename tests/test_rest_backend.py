@@ -46,6 +46,8 @@ class TestRESTBackend(mixins.HTTPMixin):
         adapter = adapters.DictAdapter(recursive=True)
         r = adapter.parse(payload, Post)
         self.assertTrue(isinstance(r.author, models.Model))
+        # input data is left untouched
+        self.assertEqual(payload['author'], {'id': 1, 'name': 'Roger'})
 
     @requests_mock.mock()
     def test_can_query_all_instances(self, m):
@@ -149,3 +151,37 @@ class TestRESTBackend(mixins.HTTPMixin):
 
         with self.assertRaises(exceptions.StoreError):
             result = manager.all().get(id=1)
+
+    def test_store_session_uses_connection_pool(self):
+        store = http.RESTStore(base_url='http://api', pool_maxsize=5, max_retries=2)
+        adapter = store.session.get_adapter('http://api/posts')
+        self.assertEqual(adapter._pool_maxsize, 5)
+        self.assertEqual(adapter.max_retries.total, 2)
+
+    def test_store_keeps_provided_session(self):
+        session = requests.Session()
+        store = http.RESTStore(base_url='http://api', session=session)
+        self.assertIs(store.session, session)
+
+    @requests_mock.mock()
+    def test_can_select_many_queries_concurrently(self, m):
+        posts = self.db['posts']
+        m.get('http://api/posts?id=1', text=json.dumps([posts[0]]), headers={'Content-Type': 'application/json'},)
+        m.get('http://api/posts?id=2', text=json.dumps([posts[1]]), headers={'Content-Type': 'application/json'},)
+
+        manager = self.store.query(Post, adapter=adapters.DictAdapter())
+        queries = [manager.filter(id=2).query, manager.filter(id=1).query]
+
+        results = self.store.handle_select_many(queries, Post)
+        self.assertEqual(results, [[posts[1]], [posts[0]]])
+
+    def test_simple_querystring_builder_nested_args(self):
+        builder = http.SimpleQueryStringBuilder()
+        q = (Post.id == 1) & ((Post.id == 2) & (Post.author == 'Kurt')) & (Post.id == 3)
+        d = builder.build(q)
+        expected = {
+            'id': [1, 2, 3],
+            'author': ['Kurt'],
+        }
+
+        self.assertEqual(d, expected)
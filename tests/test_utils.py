@@ -0,0 +1,61 @@
+import unittest
+
+from lifter import utils
+
+
+class TestUtils(unittest.TestCase):
+
+    def test_to_snake_case(self):
+        self.assertEqual(utils.to_snake_case('authorId'), 'author_id')
+        self.assertEqual(utils.to_snake_case('LastModified'), 'last_modified')
+        # second call is served from the cache
+        self.assertEqual(utils.to_snake_case('authorId'), 'author_id')
+        self.assertIn('authorId', utils.to_snake_case.cache)
+
+    def test_to_camel_case(self):
+        self.assertEqual(utils.to_camel_case('author_id'), 'authorId')
+        self.assertEqual(utils.to_camel_case('id'), 'id')
+
+    def test_memoize_clears_cache_when_full(self):
+        calls = []
+
+        @utils.memoize(maxsize=2)
+        def double(v):
+            calls.append(v)
+            return v * 2
+
+        self.assertEqual(double(1), 2)
+        self.assertEqual(double(1), 2)
+        self.assertEqual(calls, [1])
+        double(2)
+        double(3)
+        self.assertEqual(len(double.cache), 1)
+
+    def test_resolve_attr_caches_resolver_per_type_and_name(self):
+        class Obj(object):
+            pass
+
+        o = Obj()
+        o.name = 'test'
+        self.assertEqual(utils.resolve_attr(o, 'name'), 'test')
+        self.assertEqual(utils.resolve_attr({'name': 'test'}, 'name'), 'test')
+        self.assertIn((Obj, 'name'), utils._RESOLVER_CACHE)
+        self.assertIn((dict, 'name'), utils._RESOLVER_CACHE)
+
+        with self.assertRaises(utils.exceptions.MissingField):
+            utils.resolve_attr(Obj(), 'name')
+        with self.assertRaises(utils.exceptions.MissingField):
+            utils.resolve_attr({}, 'name')
+
+        r = utils.resolve_attr([o, {'name': 'other'}], 'name')
+        self.assertTrue(isinstance(r, utils.IterableAttr))
+        self.assertEqual(r.get_resolved_items(), ('test', 'other'))
+
+    def test_unique_everseen(self):
+        self.assertEqual(utils.unique_everseen([3, 1, 3, 2, 1]), [3, 1, 2])
+        self.assertEqual(list(utils.iunique_everseen(iter([3, 1, 3, 2, 1]))), [3, 1, 2])
+
+    def test_unique_everseen_with_unhashable_values(self):
+        values = [1, {'a': 1}, [2], 1, {'a': 1}, [2], {'a': 2}]
+        self.assertEqual(utils.unique_everseen(values), [1, {'a': 1}, [2], {'a': 2}])
+        self.assertEqual(utils.unique_everseen(iter(values)), [1, {'a': 1}, [2], {'a': 2}])